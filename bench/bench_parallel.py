@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""Scaling benchmark for ``f90lex.lex_files``.
+
+Usage: bench_parallel.py [nfiles] [max_jobs]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from f90lex import lex_files
+
+import corpus
+
+
+def bench_parallel():
+    nfiles = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    max_jobs = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        paths = []
+        for n in range(nfiles):
+            path = os.path.join(tmpdir, 'mod_{}.F90'.format(n))
+            with open(path, 'w') as f:
+                f.write(corpus.generate('mixed', 750, seed=n))
+            paths.append(path)
+
+        jobs = 1
+        t_serial = None
+        while jobs <= max_jobs:
+            start = time.perf_counter()
+            lex_files(paths, jobs=jobs)
+            elapsed = time.perf_counter() - start
+            if t_serial is None:
+                t_serial = elapsed
+            print('jobs: {:3d}  time: {:7.3f}s  speedup: {:5.2f}'
+                  ''.format(jobs, elapsed, t_serial / elapsed))
+            jobs *= 2
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    bench_parallel()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""Throughput benchmarks for f90lex.
+
+Each benchmark is run over each workload of the synthetic corpus, and reports
+the throughput in lines and bytes per second (the best of several runs):
+
+``parse``
+   ``Scanner.parse`` over each line of the source
+``lex``
+   ``Lexer`` iteration over all statements
+``render``
+   ``Lexer`` iteration and roundtrip rendering with ``f90lex.render``
+
+Results may be saved as a baseline with ``--save``, and compared to a baseline
+with ``--check``.  A benchmark fails the check if its throughput falls below
+``--threshold`` times the baseline, and the script then exits with an error.
+Baselines are only comparable on the same machine.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from f90lex import render
+from f90lex.lexer import Lexer
+from f90lex.scanner import Scanner, RegexScanner
+
+import corpus
+
+default_baseline = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+scanners = {
+    'Scanner': Scanner,
+    'RegexScanner': RegexScanner,
+}
+
+
+def bench_parse(text, scanner):
+    lines = io.StringIO(text).readlines()
+    start = time.perf_counter()
+    parser = scanner()
+    for line in lines:
+        parser.parse(line)
+    return time.perf_counter() - start
+
+
+def bench_lex(text, scanner):
+    start = time.perf_counter()
+    for stmt in Lexer(io.StringIO(text), scanner=scanner):
+        pass
+    return time.perf_counter() - start
+
+
+def bench_render(text, scanner):
+    out = io.StringIO()
+    start = time.perf_counter()
+    render(Lexer(io.StringIO(text), scanner=scanner), out)
+    elapsed = time.perf_counter() - start
+
+    assert out.getvalue() == text
+    return elapsed
+
+
+benchmarks = {
+    'parse': bench_parse,
+    'lex': bench_lex,
+    'render': bench_render,
+}
+
+
+def run(workloads, nlines, repeat):
+    """Return the lines and bytes per second of each benchmark."""
+    results = {}
+    for workload in workloads:
+        text = corpus.generate(workload, nlines)
+        nlines_text = text.count('\n')
+        nbytes = len(text.encode('utf-8'))
+
+        for bench_name, bench in sorted(benchmarks.items()):
+            for scanner_name, scanner in sorted(scanners.items()):
+                elapsed = min(bench(text, scanner) for i in range(repeat))
+                name = '{}[{}]:{}'.format(bench_name, scanner_name, workload)
+                results[name] = {
+                    'lines_per_sec': nlines_text / elapsed,
+                    'bytes_per_sec': nbytes / elapsed,
+                }
+                print('{:40s} {:12.0f} lines/s {:8.2f} MB/s'.format(
+                    name, nlines_text / elapsed, nbytes / elapsed / 2**20))
+
+    return results
+
+
+def check(results, baseline, threshold):
+    """Return the benchmarks which fell below the baseline threshold."""
+    failed = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        ratio = result['lines_per_sec'] / baseline[name]['lines_per_sec']
+        if ratio < threshold:
+            failed.append(name)
+            print('f90lex: regression: {} is {:.2f} of baseline'
+                  ''.format(name, ratio))
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workload', action='append',
+                        choices=['mixed'] + sorted(corpus.workloads),
+                        help='workloads to run (default: all)')
+    parser.add_argument('--lines', type=int, default=10000,
+                        help='lines per workload')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='runs per benchmark')
+    parser.add_argument('--save', nargs='?', const=default_baseline,
+                        help='save results as a baseline')
+    parser.add_argument('--check', nargs='?', const=default_baseline,
+                        help='compare results to a baseline')
+    parser.add_argument('--threshold', type=float, default=0.8,
+                        help='minimum fraction of baseline throughput')
+    args = parser.parse_args()
+
+    workloads = args.workload or ['mixed'] + sorted(corpus.workloads)
+    results = run(workloads, args.lines, args.repeat)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.check:
+        with open(args.check) as f:
+            baseline = json.load(f)
+        if check(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""Synthetic Fortran corpus for f90lex benchmarks.
+
+Each workload is a function which returns the lines of a program unit, and
+stresses a particular part of the lexer.  Sources are generated from a seeded
+random generator, so that a corpus is identical across runs.
+"""
+import itertools
+import random
+
+names = ['x', 'y', 'z', 'temp', 'salt', 'u_vel', 'v_vel', 'h', 'dt', 'area',
+         'mask', 'flux', 'rho', 'press', 'eta', 'tau_x', 'tau_y', 'visc']
+operators = [' + ', ' - ', ' * ', ' / ', '**', ' .and. ', ' == ']
+
+
+def expression(rng, nterms):
+    terms = []
+    for i in range(nterms):
+        if rng.random() < 0.3:
+            term = '{:.{}f}d0'.format(rng.uniform(0, 100), rng.randint(1, 6))
+        else:
+            term = '{}(i,j)'.format(rng.choice(names))
+        terms.append(term)
+        terms.append(rng.choice(operators))
+    return ''.join(terms[:-1])
+
+
+def continued(rng, n):
+    """Long statements continued over many lines."""
+    lines = []
+    for i in range(n // 8):
+        lines.append('  {}(i,j) = {} &\n'.format(rng.choice(names),
+                                                 expression(rng, 3)))
+        for j in range(6):
+            lines.append('      & + {} &\n'.format(expression(rng, 3)))
+        lines.append('      & + {}\n'.format(expression(rng, 2)))
+    return lines
+
+
+def comments(rng, n):
+    """Comment blocks with occasional statements."""
+    words = ['the', 'flux', 'is', 'computed', 'from', 'a', 'centered',
+             'difference', 'of', 'thickness', 'and', 'velocity', 'TODO:']
+    lines = []
+    for i in range(n):
+        if i % 5 == 4:
+            lines.append('  {} = {}  ! {}\n'.format(
+                rng.choice(names), expression(rng, 2), rng.choice(words)))
+        else:
+            text = ' '.join(rng.choice(words) for j in range(12))
+            lines.append('  ! {}\n'.format(text))
+    return lines
+
+
+def data(rng, n):
+    """Large DATA blocks of numeric literals."""
+    lines = []
+    for i in range(n // 10):
+        lines.append('  data table_{} / &\n'.format(i))
+        for j in range(9):
+            values = ', '.join('{:.4e}'.format(rng.uniform(-1e3, 1e3))
+                               for k in range(6))
+            end = ' /' if j == 8 else ', &'
+            lines.append('    {}{}\n'.format(values, end))
+    return lines
+
+
+def statement(rng, n):
+    """A single array constructor continued over every line."""
+    lines = ['  table = [ &\n']
+    for i in range(n - 2):
+        values = ', '.join('{:.4e}'.format(rng.uniform(-1e3, 1e3))
+                           for k in range(4))
+        lines.append('    {}, &\n'.format(values))
+    lines.append('    0.0 ]\n')
+    return lines
+
+
+def ifdef(rng, n):
+    """Many short preprocessor conditional regions."""
+    macros = ['USE_MPI', 'USE_OPENMP', 'DEBUG', 'STATIC_MEMORY']
+    lines = []
+    for i in range(n // 6):
+        lines.append('#ifdef {}\n'.format(rng.choice(macros)))
+        lines.append('  call {}_init(ierr)\n'.format(rng.choice(names)))
+        lines.append('  {} = {}\n'.format(rng.choice(names),
+                                          expression(rng, 2)))
+        lines.append('#else\n')
+        lines.append('  {} = 0.\n'.format(rng.choice(names)))
+        lines.append('#endif\n')
+    return lines
+
+
+def strings(rng, n):
+    """Character strings, including strings split across lines."""
+    words = ['Error', 'in', 'model', 'step', "it's", 'a "quote"', 'value']
+    lines = []
+    for i in range(n // 3):
+        text = ' '.join(rng.choice(words) for j in range(6))
+        lines.append("  call log_msg('{}', {})\n".format(
+            text.replace("'", "''"), rng.choice(names)))
+        lines.append('  msg = "{} &\n'.format(text.replace('"', '""')))
+        lines.append('    &{}"\n'.format(rng.choice(words).replace('"', '""')))
+    return lines
+
+
+def chained(rng, n):
+    """Statements chained by semicolons."""
+    lines = []
+    for i in range(n):
+        stmts = ['{} = {}'.format(rng.choice(names), expression(rng, 2))
+                 for j in range(rng.randint(2, 5))]
+        lines.append('  ' + ' ; '.join(stmts) + '\n')
+    return lines
+
+
+workloads = {
+    'continued': continued,
+    'comments': comments,
+    'data': data,
+    'ifdef': ifdef,
+    'strings': strings,
+    'chained': chained,
+    'statement': statement,
+}
+
+# Workloads of the mixed corpus
+# NOTE: This list is fixed, so that new workloads do not change the mixed
+#   corpus (and invalidate its saved baselines).
+mixed_workloads = ['chained', 'comments', 'continued', 'data', 'ifdef',
+                   'strings']
+
+
+def generate(workload='mixed', nlines=10000, seed=0):
+    """Return the source text of a workload, of about ``nlines`` lines.
+
+    The ``mixed`` workload is a module with subroutines of each workload in
+    ``mixed_workloads``.
+    """
+    rng = random.Random(seed)
+
+    if workload == 'mixed':
+        kinds = mixed_workloads
+        size = 200
+    else:
+        kinds = [workload]
+        size = nlines
+
+    lines = ['module bench_{}\n'.format(workload),
+             '  implicit none\n',
+             'contains\n']
+    n = 0
+    for i in itertools.count():
+        if n >= nlines:
+            break
+        kind = kinds[i % len(kinds)]
+        body = workloads[kind](rng, min(size, nlines - n) or 1)
+        lines.append('subroutine {}_{}\n'.format(kind, n))
+        lines.extend(body)
+        lines.append('end subroutine {}_{}\n'.format(kind, n))
+        n += len(body) + 2
+    lines.append('end module bench_{}\n'.format(workload))
+
+    return ''.join(lines)
@@ -0,0 +1,9 @@
+__version__ = '0.1.0'
+
+from f90lex.cache import TokenCache
+from f90lex.chunks import lex_chunks
+from f90lex.configs import lex_configs
+from f90lex.depends import depends_files
+from f90lex.index import StatementIndex
+from f90lex.project import lex_files
+from f90lex.writer import render, verify
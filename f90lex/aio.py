@@ -0,0 +1,178 @@
+"""Asynchronous f90lex lexing.
+
+``AsyncLexer`` is an asynchronous iterator over the statements of a source,
+for use within an ``asyncio`` event loop (e.g. a language server).  Statements
+are read from a ``Lexer`` in batches of about ``lines`` source lines, and
+control is returned to the event loop between batches, so that other tasks
+are not blocked by a large source.
+
+The batches may instead be lexed by an ``executor``.  A thread executor (such
+as ``concurrent.futures.ThreadPoolExecutor``) lexes each batch in a worker
+thread.  A process executor lexes the entire source into a ``TokenStream`` in
+a worker process, whose statements are then returned in batches.
+
+Lexing is stopped by ``cancel``, or by cancellation of the task which is
+iterating over the lexer.  ``DocumentLexer`` uses this to cancel the lexing of
+a document when a newer version of the document is submitted.
+
+:copyright: Copyright 2021 Marshall Ward, see AUTHORS for details.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+import asyncio
+from collections import deque
+import concurrent.futures
+import functools
+import io
+
+from f90lex.lexer import Lexer, is_binary
+
+# Default number of source lines of each batch
+batch_lines = 100
+
+
+class AsyncLexer(object):
+    """An asynchronous iterator over the statements of a source.
+
+    ``source`` is either a file, an iterator of lines, or the text of the
+    source.  Any keyword arguments (e.g. ``scanner`` or ``defines``) are
+    passed to the ``Lexer``.
+    """
+    def __init__(self, source, lines=batch_lines, executor=None, **kwargs):
+        if isinstance(source, str):
+            source = io.StringIO(source)
+        self.source = source
+        self.lines = lines
+        self.executor = executor
+        self.kwargs = kwargs
+
+        # True if the source is lexed by a worker process
+        self.remote = isinstance(executor,
+                                 concurrent.futures.ProcessPoolExecutor)
+
+        # Lexer of the source (unless remote), an iterator over its
+        # statements, and the liminals which precede the first statement
+        self.lexer = None
+        self.statements = None
+        self.head = None
+
+        # Statements of the current batch
+        self.pending = deque()
+        self.done = False
+        self.cancelled = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self.pending or self.cancelled:
+            if self.cancelled:
+                raise asyncio.CancelledError()
+            if self.done:
+                raise StopAsyncIteration
+
+            loop = asyncio.get_running_loop()
+            try:
+                if self.remote and self.statements is None:
+                    await self.lex_remote(loop)
+                elif self.executor is None or self.remote:
+                    await asyncio.sleep(0)
+                    self.read_batch()
+                else:
+                    await loop.run_in_executor(self.executor,
+                                               self.read_batch)
+            except asyncio.CancelledError:
+                # Stop any batch of a worker thread
+                self.cancel()
+                raise
+
+        return self.pending.popleft()
+
+    def cancel(self):
+        """Stop lexing the source, and discard any unreturned statements.
+
+        A batch in a worker thread is stopped after its current statement.
+        """
+        self.cancelled = True
+        self.pending.clear()
+
+    async def collect(self):
+        """Return a list of the remaining statements."""
+        return [stmt async for stmt in self]
+
+    def read_batch(self):
+        # Read the statements of the next ``lines`` lines
+        if self.statements is None:
+            self.lexer = Lexer(self.source, **self.kwargs)
+            self.statements = self.lexer
+            self.head = self.lexer.prior_tail
+
+        start = self.lexer.lineno if self.lexer else 0
+        count = 0
+        for stmt in self.statements:
+            self.pending.append(stmt)
+            count += 1
+
+            # Header and stream statements are counted as single lines
+            lines = self.lexer.lineno - start if self.lexer else 0
+            if self.cancelled or max(lines, count) >= self.lines:
+                return
+
+        self.done = True
+
+    async def lex_remote(self, loop):
+        # Lex the source in a worker process, and read from its stream
+        source = self.source
+        name = getattr(source, 'name', None)
+        if is_binary(source):
+            text = source.read()
+        else:
+            text = ''.join(source)
+
+        stream = await loop.run_in_executor(
+            self.executor,
+            functools.partial(lex_text, text, name, **self.kwargs)
+        )
+        self.statements = iter(stream)
+        self.head = stream.head
+
+
+def lex_text(text, name=None, **kwargs):
+    """Return the ``TokenStream`` of a source text (or bytes)."""
+    source = io.BytesIO(text) if isinstance(text, bytes) else io.StringIO(text)
+    if name is not None:
+        source.name = name
+    return Lexer(source, **kwargs).stream()
+
+
+class DocumentLexer(object):
+    """Asynchronous lexing of the latest version of each document.
+
+    Each request to ``lex`` a document cancels any unfinished request for the
+    same document.  Any arguments are passed to each ``AsyncLexer``.
+    """
+    def __init__(self, lines=batch_lines, executor=None, **kwargs):
+        self.lines = lines
+        self.executor = executor
+        self.kwargs = kwargs
+
+        # Unfinished tasks of each document
+        self.tasks = {}
+
+    def lex(self, key, source):
+        """Return a task of the statements of a document.
+
+        The task of a superseded request is cancelled.
+        """
+        prior = self.tasks.get(key)
+        if prior is not None:
+            prior.cancel()
+
+        lexer = AsyncLexer(source, self.lines, self.executor, **self.kwargs)
+        task = asyncio.ensure_future(lexer.collect())
+        self.tasks[key] = task
+        task.add_done_callback(functools.partial(self.discard, key))
+        return task
+
+    def discard(self, key, task):
+        if self.tasks.get(key) is task:
+            del self.tasks[key]
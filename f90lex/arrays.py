@@ -0,0 +1,164 @@
+"""NumPy arrays of f90lex token streams.
+
+``stream_arrays`` converts the tokens of a ``TokenStream`` into NumPy
+structured arrays, with one record per token (see ``token_fields``).  The
+columns are built directly from the stream arrays, so the ``Token`` objects of
+the statements are never created.  The records are produced in batches of
+whole statements, rather than as a single array.
+
+Token values are stored as indices into a ``StringTable``, which may be shared
+by many streams, so that the values of a project can be counted or compared as
+integers.  Offsets are positions in the rendered text of the stream.
+
+``project_arrays`` produces the records of each file in a project, and tags
+each record with the index of its file.
+
+NumPy is an optional dependency of f90lex, and is only required by this
+module.
+
+:copyright: Copyright 2021 Marshall Ward, see AUTHORS for details.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from f90lex.lexer import Lexer
+from f90lex.project import lex_file
+from f90lex.scanner import RegexScanner
+from f90lex.stream import TokenStream
+
+# Fields of the token records
+token_fields = [
+    ('file', 'u4'),             # Index of the source file
+    ('stmt', 'u4'),             # Index of the statement in the file
+    ('index', 'u4'),            # Index of the token in the statement
+    ('kind', 'i1'),             # Lexeme kind, or -1 if unknown
+    ('start', 'u4'),            # Start of rendered token text
+    ('end', 'u4'),              # End of rendered token text
+    ('line', 'u4'),             # Source line, or 0 if unknown
+    ('col', 'u4'),              # Source column
+    ('liminal_size', 'u4'),     # Length of the tail liminals
+    ('value', 'u4'),            # Index of token value in the string table
+    ('ptoken', '?'),            # Token is a preprocessed ``PToken``
+    ('split', '?'),             # Token was split across lines
+]
+
+# Default number of tokens in each batch
+batch_size = 1 << 16
+
+
+class StringTable(object):
+    """A table of unique strings, indexed by their order of insertion."""
+    def __init__(self):
+        self.ids = {}
+        self.values = []
+
+    def add(self, values):
+        """Add strings to the table, and return a list of their indices."""
+        ids = self.ids
+        n_ids = len(ids)
+        result = [ids.setdefault(v, len(ids)) for v in values]
+        if len(ids) > n_ids:
+            self.values.extend(itertools.islice(ids, n_ids, None))
+        return result
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, idx):
+        return self.values[idx]
+
+
+def stream_arrays(stream, strings=None, size=batch_size, file_id=0):
+    """Generate structured arrays of the tokens of a ``TokenStream``.
+
+    A ``Lexer`` is first converted to a ``TokenStream``.  Each array contains
+    the tokens of consecutive statements, with at least ``size`` tokens
+    (except for the final array).  Token values are added to the
+    ``StringTable`` ``strings``.
+    """
+    if numpy is None:
+        raise ImportError('f90lex: NumPy is required for token arrays.')
+    if strings is None:
+        strings = StringTable()
+    if isinstance(stream, Lexer):
+        stream = stream.stream()
+
+    n_toks = len(stream.tok_flags)
+    if not n_toks:
+        return
+
+    columns = {name: numpy.frombuffer(getattr(stream, name),
+                                      dtype=getattr(stream, name).typecode)
+               for name in TokenStream.columns}
+
+    # Statement of each token, and the start of each statement
+    stmt_start = columns['stmt_start'].astype('u4')
+    stmt_sizes = numpy.diff(stmt_start, append=n_toks)
+    stmt = numpy.repeat(numpy.arange(len(stmt_start), dtype='u4'),
+                        stmt_sizes)
+
+    # The tail liminals of a token span its end to the start of the next token
+    tok_start = columns['tok_start']
+    tok_end = columns['tok_end']
+    next_start = numpy.append(tok_start[1:], len(stream.text))
+
+    flags = columns['tok_flags']
+    text = stream.text
+
+    first = 0
+    while first < len(stmt_start):
+        start = stmt_start[first]
+        last = numpy.searchsorted(stmt_start, start + size)
+        last = max(int(last), first + 1)
+        end = stmt_start[last] if last < len(stmt_start) else n_toks
+
+        records = numpy.empty(end - start, dtype=token_fields)
+        records['file'] = file_id
+        records['stmt'] = stmt[start:end]
+        records['index'] = (numpy.arange(start, end, dtype='u4')
+                            - stmt_start[stmt[start:end]])
+        records['kind'] = columns['tok_kind'][start:end]
+        records['start'] = tok_start[start:end]
+        records['end'] = tok_end[start:end]
+        records['line'] = columns['tok_line'][start:end]
+        records['col'] = columns['tok_col'][start:end]
+        records['liminal_size'] = next_start[start:end] - tok_end[start:end]
+        records['ptoken'] = flags[start:end] & TokenStream.PREPROC
+        records['split'] = flags[start:end] & TokenStream.SPLIT
+
+        values = [text[i:j] if v < 0 else stream.values[v]
+                  for i, j, v in zip(stream.tok_start[start:end],
+                                     stream.tok_end[start:end],
+                                     stream.tok_value[start:end])]
+        records['value'] = strings.add(values)
+
+        yield records
+        first = last
+
+
+def project_arrays(sources, strings=None, size=batch_size, defines=None,
+                   scanner=RegexScanner, cache=None, include_paths=None):
+    """Generate structured arrays of the tokens of a project.
+
+    ``sources`` is either a mapping of paths to their ``TokenStream`` (e.g.
+    from ``lex_files``), or a sequence of paths, which are lexed one file at a
+    time.  The ``file`` field of each token is the index of its path in
+    ``sources``.
+    """
+    if strings is None:
+        strings = StringTable()
+
+    for file_id, path in enumerate(sources):
+        if hasattr(sources, 'keys'):
+            stream = sources[path]
+        else:
+            stream = lex_file(path, defines=defines, scanner=scanner,
+                              cache=cache, include_paths=include_paths)
+
+        for records in stream_arrays(stream, strings, size, file_id):
+            yield records
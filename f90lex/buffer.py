@@ -0,0 +1,105 @@
+"""The f90lex source buffer.
+
+``SourceBuffer`` holds an entire source file, either as a string, as bytes, or
+as a memory map of the file, which is scanned in a single pass.  The lexemes
+are reported as ``(start, end)`` offsets into the shared buffer, and the text
+of a lexeme is only produced on request.
+
+A ``SourceBuffer`` is also an iterator over its lines, and can be passed to
+``Lexer`` in place of a file.  Lines are decoded as they are read, so files
+need not be held in memory as a list of strings.  Bytes which cannot be
+decoded are decoded as surrogate escapes, and endlines are translated, as in
+``Lexer``.
+
+:copyright: Copyright 2021 Marshall Ward, see AUTHORS for details.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+import mmap
+
+from f90lex.lexer import translate_endlines
+from f90lex.scanner import RegexScanner
+
+
+class SourceBuffer(object):
+    """A whole-file source buffer with offset-based lexemes."""
+    def __init__(self, data, encoding='utf-8'):
+        self.data = data
+        self.encoding = encoding
+
+        # Line iterator, for use as a source
+        self.line_texts = self.text_lines()
+
+    @classmethod
+    def open(cls, path, encoding='utf-8'):
+        """Create a buffer from a memory map of the file at ``path``."""
+        with open(path, 'rb') as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped
+                data = b''
+        return cls(data, encoding)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return self.__next__()
+
+    def __next__(self):
+        return next(self.line_texts)
+
+    def __len__(self):
+        return len(self.data)
+
+    def lines(self):
+        """Generate the ``(start, end)`` offsets of each line."""
+        newline = '\n' if isinstance(self.data, str) else b'\n'
+        pos = 0
+        size = len(self.data)
+        while pos < size:
+            end = self.data.find(newline, pos) + 1
+            if end == 0:
+                end = size
+            yield pos, end
+            pos = end
+
+    def text_lines(self):
+        """Generate the decoded lines of the buffer.
+
+        Endlines are translated as in text-mode files, so a line of ``lines()``
+        with ``\r`` endlines may produce several lines.
+        """
+        for start, end in self.lines():
+            line = self.text(start, end)
+            if '\r' in line:
+                for part in translate_endlines(line):
+                    yield part
+            else:
+                yield line
+
+    def text(self, start, end):
+        """Return the text between two offsets of the buffer."""
+        text = self.data[start:end]
+        if not isinstance(text, str):
+            text = text.decode(self.encoding, 'surrogateescape')
+        return text
+
+    def scan(self, scanner=None):
+        """Generate the lexeme offsets of each line of the buffer.
+
+        See ``RegexScanner.scan`` for a description of the offsets.
+        """
+        if scanner is None:
+            scanner = RegexScanner()
+        return scanner.scan(self.data, encoding=self.encoding)
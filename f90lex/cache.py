@@ -0,0 +1,178 @@
+"""Persistent f90lex token cache.
+
+``TokenCache`` stores the lexed statements of source files in a directory, as
+compressed ``TokenStream`` data.  Each entry is keyed by the file contents and
+path, the f90lex version, the initial preprocessor ``defines`` and the header
+search paths, so an unchanged file is restored from the cache without being
+scanned.
+
+The cache directory is bounded by ``max_size`` (in bytes).  Entries are touched
+on each use, and the least recently used entries are removed when the cache
+grows past its limit.
+
+Each entry also records the stamps of its ``#include`` headers (see
+``include.header_stamp``), and an entry is not used if any of these headers
+have changed.
+
+:copyright: Copyright 2021 Marshall Ward, see AUTHORS for details.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+import hashlib
+import io
+import json
+import os
+import tempfile
+import zlib
+
+import f90lex
+from f90lex.include import header_changed
+from f90lex.lexer import Lexer
+from f90lex.scanner import RegexScanner
+from f90lex.stream import TokenStream
+
+
+class TokenCache(object):
+    """A size-bounded directory of lexed token streams."""
+
+    suffix = '.f90tok'
+
+    def __init__(self, directory, max_size=256 * 2**20):
+        self.directory = directory
+        self.max_size = max_size
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # Current size of the cache directory, if known
+        self.size = None
+
+    def __getstate__(self):
+        # Recompute the directory size in other processes
+        state = self.__dict__.copy()
+        state['size'] = None
+        return state
+
+    def key(self, data, defines=None, encoding=None, include_paths=None,
+            path=None):
+        """Return the cache key of the source ``data`` (in bytes).
+
+        Headers are searched in the directory of the source ``path``, in
+        ``include_paths`` and in the current directory, so the key includes
+        these directories.
+        """
+        search = [os.path.abspath(path) if path else None]
+        search.extend(os.path.abspath(idir)
+                      for idir in list(include_paths or []) + [os.curdir])
+        key = hashlib.sha256()
+        key.update(f90lex.__version__.encode('utf-8') + b'\0')
+        key.update(repr(encoding).encode('utf-8') + b'\0')
+        key.update(repr(search).encode('utf-8') + b'\0')
+        for name, replacement in sorted((defines or {}).items()):
+            key.update(repr((name, replacement)).encode('utf-8') + b'\0')
+        key.update(data)
+        return key.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + TokenCache.suffix)
+
+    def get(self, key):
+        """Return the stream of a cache key, or ``None`` if not present.
+
+        ``None`` is also returned if any included header has changed.
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                headers = [tuple(stamp) for stamp in json.loads(f.readline())]
+                if any(header_changed(stamp) for stamp in headers):
+                    return None
+                data = f.read()
+            stream = TokenStream.frombytes(zlib.decompress(data))
+        except (IOError, OSError, ValueError, TypeError, zlib.error):
+            return None
+
+        # Mark the entry as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        return stream
+
+    def put(self, key, stream, headers=()):
+        """Store a token stream under a cache key.
+
+        ``headers`` are the stamps of the included headers, as returned by
+        ``include.header_stamp``.
+        """
+        data = (json.dumps(list(headers)).encode('utf-8') + b'\n'
+                + zlib.compress(stream.tobytes(), 1))
+
+        # Write atomically, in case of concurrent readers
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path(key))
+
+        if self.size is None:
+            self.size = sum(size for path, size, mtime in self.entries())
+        else:
+            self.size += len(data)
+
+        if self.size > self.max_size:
+            self.evict()
+
+    def entries(self):
+        """Return the path, size, and last use of each cache entry."""
+        entries = []
+        for fname in os.listdir(self.directory):
+            if not fname.endswith(TokenCache.suffix):
+                continue
+            path = os.path.join(self.directory, fname)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def evict(self):
+        """Remove the least recently used entries until within ``max_size``."""
+        entries = sorted(self.entries(), key=lambda e: e[2])
+        size = sum(e[1] for e in entries)
+        for path, entry_size, mtime in entries:
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= entry_size
+        self.size = size
+
+    def lex(self, path, defines=None, scanner=RegexScanner, encoding=None,
+            include_paths=None):
+        """Return the token stream of a source file, using the cache.
+
+        Sources are decoded as in ``Lexer``, unless an ``encoding`` is given.
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        key = self.key(data, defines, encoding, include_paths, path)
+        stream = self.get(key)
+        if stream is None:
+            # Headers are searched as for the source file
+            buf = io.BytesIO(data)
+            buf.name = path
+            if encoding is None:
+                src = buf
+            else:
+                src = io.TextIOWrapper(buf, encoding=encoding,
+                                       errors='surrogateescape')
+            lexer = Lexer(src, scanner=scanner, defines=defines,
+                          include_paths=include_paths)
+            stream = lexer.stream()
+            self.put(key, stream, lexer.include_stamps)
+
+        return stream
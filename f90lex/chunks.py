@@ -0,0 +1,152 @@
+"""Parallel f90lex lexing of a single file.
+
+``lex_chunks`` divides a large source file into chunks, lexes each chunk in a
+separate worker process, and joins the token streams of the chunks.  The
+result is identical to the ``TokenStream`` of a ``Lexer`` of the binary file.
+
+Chunks may only start at a line which follows a complete statement, so that
+the lexer can be resumed from the start of the line (as in
+``IncrementalLexer``).  The start of a chunk must follow an active line of
+code which does not continue a statement or a string, and must not be in an
+inactive region.  Comment and blank lines are ignored in this test.
+
+The lexer state at each chunk is found by a sequential pass over the lines,
+which only preprocesses the directives.  Other lines are only scanned if they
+contain a ``&`` or string delimiter, since no other line can continue a
+statement or change the state of a split string.
+
+:copyright: Copyright 2021 Marshall Ward, see AUTHORS for details.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+import io
+import os
+
+from f90lex.lexer import Lexer, decode_lines
+from f90lex.project import map_tasks
+from f90lex.scanner import (RegexScanner, CONTINUATION, COMMENT, WHITESPACE,
+                            ENDLINE)
+from f90lex.stream import TokenStream
+
+# Smallest default chunk size, in bytes
+min_chunk_size = 1 << 20
+
+# Kinds of comment and blank lines
+spacing_kinds = frozenset((COMMENT, WHITESPACE, ENDLINE))
+
+
+def lex_chunks(path, jobs=None, defines=None, scanner=RegexScanner,
+               include_paths=None, chunk_size=None):
+    """Lex a single source file over a pool of ``jobs`` processes.
+
+    The file is divided into one chunk per job, or chunks of about
+    ``chunk_size`` bytes (by default, at least ``min_chunk_size``).  A
+    ``TokenStream`` of the file is returned.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(os.path.getsize(path) // jobs, min_chunk_size)
+
+    points = split_points(path, chunk_size, defines, scanner, include_paths)
+    ends = [offset for offset, state in points[1:]] + [None]
+    tasks = [(path, offset, end, state, scanner, include_paths)
+             for (offset, state), end in zip(points, ends)]
+
+    streams = map_tasks(chunk_task, tasks, jobs)
+    return TokenStream.join(streams)
+
+
+def split_points(path, chunk_size, defines=None, scanner=RegexScanner,
+                 include_paths=None):
+    """Return the chunks of a file, as their byte offsets and lexer states.
+
+    Each chunk starts at the first safe line after ``chunk_size`` bytes from
+    the start of the prior chunk.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        # An empty lexer, whose source is replaced by the file lines
+        empty = io.BytesIO()
+        empty.name = path
+        pp = Lexer(empty, scanner=scanner, defines=defines,
+                   include_paths=include_paths)
+        pp.source = decode_lines(f)
+
+        points = [(0, pp.state())]
+        target = chunk_size
+        offset = 0
+
+        # True if the next line can start a chunk, if the current statement
+        # is continued, and if any headers follow the current statement
+        safe = False
+        continued = False
+        pending = False
+
+        scanner = pp.scanner
+        for line in pp.source:
+            if safe and offset >= target and line.lstrip()[:1] != '&':
+                points.append((offset, pp.state()))
+                target = offset + chunk_size
+
+            # Stop once the final chunk is found
+            if target >= size:
+                break
+
+            pp.lineno += 1
+            if pp.stop_parsing:
+                _, line = pp.skip_inactive(line)
+                if line is None:
+                    break
+                safe = False
+
+            # Start of the next line
+            offset = f.tell()
+
+            if line[0] == '#':
+                lexemes = scanner.parse(line)
+                pp.preprocess(lexemes[0])
+
+                # Apply the macros of any headers.  Headers within a
+                # statement are returned after the statement.
+                for statements in pp.includes:
+                    for stmt in statements:
+                        pass
+                    pending = pending or continued
+                pp.includes = []
+                safe = False
+                continue
+
+            if '&' in line or '\'' in line or '"' in line:
+                scanner.parse(line)
+                kinds = scanner.kinds
+                if all(kind in spacing_kinds for kind in kinds):
+                    continue
+                continued = CONTINUATION in kinds
+            elif line.strip() and line.lstrip()[0] != '!':
+                continued = False
+            else:
+                continue
+
+            safe = not (continued or pending or scanner.prior_delim)
+            if not continued:
+                pending = False
+
+    return points
+
+
+def chunk_task(task):
+    return lex_chunk(*task)
+
+
+def lex_chunk(path, start, end, state, scanner=RegexScanner,
+              include_paths=None):
+    """Return the ``TokenStream`` of a chunk of a file, from a lexer state."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read() if end is None else f.read(end - start)
+
+    src = io.BytesIO(data)
+    src.name = path
+    lexer = Lexer(src, scanner=scanner, state=state,
+                  include_paths=include_paths)
+    return lexer.stream()
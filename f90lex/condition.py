@@ -0,0 +1,239 @@
+"""f90lex preprocessor conditions.
+
+``evaluate`` returns the value of the expression of an ``#if`` or ``#elif``
+directive under the current macros.  Each distinct expression is translated
+once into a Python code object, which is stored in ``conditions`` and shared
+by all lexers in a process, so that repeated guards are only parsed once.  At
+most ``max_conditions`` expressions are stored, and the least recently used
+expression is removed when the store is full.
+
+Expressions follow the C preprocessor: integer literals, macro names,
+``defined(NAME)`` (or ``defined NAME``), and the C unary, binary and
+conditional (``?:``) operators, with integer division and remainders
+truncated towards zero.  Macro names are replaced by the value of their
+replacement text, as an expression, and undefined names are zero.  Macro
+functions and character literals are not supported.
+
+C comments (``/* ... */`` and ``// ...``) are removed from an expression.
+
+Macro replacements are stored as Fortran lexemes, which may split a C
+operator (e.g. ``&&`` into two ``&`` lexemes), so whitespace is allowed
+within the operators of an expression.
+
+:copyright: Copyright 2021 Marshall Ward, see AUTHORS for details.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+from collections import OrderedDict
+import re
+import threading
+
+# Lexemes of an expression
+expr_lexeme = re.compile(r'''\s*(?:
+      (?P<number>(?:0[xX][0-9A-Fa-f]+|[0-9]+)[uUlL]*)
+    | (?P<name>[A-Za-z_]\w*)
+    | (?P<op>&\s*&|\|\s*\||[=!<>]\s*=|<\s*<|>\s*>|[-+*/%<>!~&|^?:()])
+)''', re.VERBOSE)
+
+# C comments within a directive
+c_comment = re.compile(r'/\*.*?\*/|//.*')
+
+# Binary operators, by increasing precedence
+binary_ops = (
+    ('||',),
+    ('&&',),
+    ('|',),
+    ('^',),
+    ('&',),
+    ('==', '!='),
+    ('<', '<=', '>', '>='),
+    ('<<', '>>'),
+    ('+', '-'),
+    ('*', '/', '%'),
+)
+
+# Python forms of the operators which differ from C
+op_formats = {
+    '||': '(1 if {} or {} else 0)',
+    '&&': '(1 if {} and {} else 0)',
+    '/': '_div({}, {})',
+    '%': '_mod({}, {})',
+    '!': '(0 if {} else 1)',
+}
+
+# Compiled conditions, keyed by expression, in order of use
+conditions = OrderedDict()
+conditions_lock = threading.Lock()
+max_conditions = 1024
+
+
+def evaluate(expr, defines, expanding=frozenset()):
+    """Return the integer value of an expression under ``defines``.
+
+    A ``ValueError`` is raised if the expression is invalid, and a
+    ``ZeroDivisionError`` if it divides by zero.
+    """
+    with conditions_lock:
+        code = conditions.get(expr)
+        if code is not None:
+            conditions.move_to_end(expr)
+
+    if code is None:
+        code = compile_condition(expr)
+        with conditions_lock:
+            conditions[expr] = code
+            while len(conditions) > max_conditions:
+                conditions.popitem(last=False)
+
+    def value(name):
+        # Self-referencing macros are not expanded again
+        lexemes = defines.get(name)
+        if not lexemes or name in expanding:
+            return 0
+        return evaluate(' '.join(lexemes), defines, expanding | {name})
+
+    env = {
+        '__builtins__': {},
+        '_value': value,
+        '_defined': defines.__contains__,
+        '_div': c_div,
+        '_mod': c_mod,
+    }
+    return eval(code, env)
+
+
+def compile_condition(expr):
+    """Return the Python code object of an expression."""
+    source = ConditionParser(expr).parse()
+    return compile(source, '<condition>', 'eval')
+
+
+class ConditionParser(object):
+    """A parser which translates an expression into Python source."""
+    def __init__(self, expr):
+        self.lexemes = []
+        self.idx = 0
+
+        text = c_comment.sub(' ', expr).strip()
+        pos = 0
+        while pos < len(text):
+            m = expr_lexeme.match(text, pos)
+            if not m:
+                self.error('unexpected {!r}'.format(text[pos:].strip()))
+            group = m.lastgroup
+            lexeme = m.group(group)
+            if group == 'op':
+                lexeme = ''.join(lexeme.split())
+            self.lexemes.append((group, lexeme))
+            pos = m.end()
+
+    def parse(self):
+        if not self.lexemes:
+            self.error('missing expression')
+        source = self.conditional()
+        if self.idx < len(self.lexemes):
+            self.error('unexpected {!r}'.format(self.lexemes[self.idx][1]))
+        return source
+
+    def conditional(self):
+        cond = self.binary(0)
+        if self.accept('?'):
+            true = self.conditional()
+            self.expect(':')
+            false = self.conditional()
+            return '({} if {} else {})'.format(true, cond, false)
+        return cond
+
+    def binary(self, level):
+        if level == len(binary_ops):
+            return self.unary()
+
+        left = self.binary(level + 1)
+        while self.peek() in binary_ops[level]:
+            op = self.lexemes[self.idx][1]
+            self.idx += 1
+            right = self.binary(level + 1)
+            fmt = op_formats.get(op, '({} ' + op + ' {})')
+            left = fmt.format(left, right)
+        return left
+
+    def unary(self):
+        op = self.peek()
+        if op in ('!', '~', '-', '+'):
+            self.idx += 1
+            operand = self.unary()
+            return op_formats.get(op, '(' + op + '{})').format(operand)
+        return self.primary()
+
+    def primary(self):
+        if self.idx == len(self.lexemes):
+            self.error('incomplete expression')
+        group, lexeme = self.lexemes[self.idx]
+        self.idx += 1
+
+        if group == 'number':
+            return str(parse_integer(lexeme))
+
+        elif group == 'name':
+            if lexeme != 'defined':
+                return '_value({!r})'.format(lexeme)
+
+            paren = self.accept('(')
+            if self.idx == len(self.lexemes) or self.peek_group() != 'name':
+                self.error('defined requires a macro name')
+            name = self.lexemes[self.idx][1]
+            self.idx += 1
+            if paren:
+                self.expect(')')
+            return '_defined({!r})'.format(name)
+
+        elif lexeme == '(':
+            source = self.conditional()
+            self.expect(')')
+            return source
+
+        self.error('unexpected {!r}'.format(lexeme))
+
+    def peek(self):
+        # Return the next operator, if any
+        if self.idx < len(self.lexemes):
+            group, lexeme = self.lexemes[self.idx]
+            if group == 'op':
+                return lexeme
+        return None
+
+    def peek_group(self):
+        return self.lexemes[self.idx][0]
+
+    def accept(self, op):
+        if self.peek() == op:
+            self.idx += 1
+            return True
+        return False
+
+    def expect(self, op):
+        if not self.accept(op):
+            self.error('expected {!r}'.format(op))
+
+    def error(self, message):
+        raise ValueError(message)
+
+
+def parse_integer(lexeme):
+    """Return the value of a C integer literal."""
+    digits = lexeme.rstrip('uUlL')
+    if digits[:2] in ('0x', '0X'):
+        return int(digits, 16)
+    elif digits[:1] == '0' and len(digits) > 1:
+        return int(digits, 8)
+    return int(digits)
+
+
+def c_div(a, b):
+    """Integer division, truncated towards zero."""
+    quot = abs(a) // abs(b)
+    return quot if (a < 0) == (b < 0) else -quot
+
+
+def c_mod(a, b):
+    """Integer remainder, with the sign of the dividend."""
+    return a - b * c_div(a, b)
@@ -0,0 +1,158 @@
+"""Multi-configuration f90lex lexing.
+
+``ConfigSource`` lexes a single source under many sets of preprocessor macros,
+as in a build with several ``-D`` configurations.  The source is read once,
+and the lexemes of each line are stored and reused by every configuration, so
+that each configuration only repeats the (much cheaper) statement assembly and
+preprocessing of ``Lexer``.
+
+Lines are stored by their text and by the split string state of the scanner
+at the start of the line, so that the reused lexemes are always identical to a
+new scan.  Lines of an inactive region are never scanned.
+
+Configurations which only differ in macros that do not appear in the source,
+either directly or within the replacement of a macro in the source (e.g. the
+macros of other files in a project), produce identical statements and share a
+single result.  Since headers may refer to any macro, this does not apply to
+sources with an ``#include`` directive.
+
+:copyright: Copyright 2021 Marshall Ward, see AUTHORS for details.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+from collections import OrderedDict
+import re
+
+from f90lex.lexer import Lexer, decode_lines, is_binary
+from f90lex.scanner import Scanner
+
+# Words of a source, which could refer to a macro
+word = re.compile(r'\w+')
+
+# Header directive at the start of a line
+include_line = re.compile(r'^#\s*include', re.MULTILINE)
+
+
+class ConfigSource(object):
+    """A source which is scanned once and lexed under many macro sets.
+
+    Any keyword arguments (e.g. ``include_paths``) are passed to each
+    ``Lexer``.
+    """
+    def __init__(self, source, scanner=Scanner, **kwargs):
+        self.name = getattr(source, 'name', None)
+        if is_binary(source):
+            source = decode_lines(source)
+        self.lines = list(source)
+        self.kwargs = kwargs
+
+        # Stored lexemes, shared by all configurations
+        self.table = {}
+        self.scanner = scanner
+
+        # Names which may refer to a macro, or None if any macro may be used
+        text = ''.join(self.lines)
+        if include_line.search(text):
+            self.names = None
+        else:
+            self.names = frozenset(word.findall(text))
+
+        # Lexed token streams, keyed by their macros
+        self.streams = {}
+
+    def key(self, defines=None):
+        """Return the macros of ``defines`` which may affect the source.
+
+        Macros which are only named in the replacement of another macro may
+        also affect the source, through the expressions of ``#if`` directives.
+        """
+        defines = defines or {}
+        names = self.names
+        if names is not None:
+            names = set(names)
+            pending = [name for name in names if name in defines]
+            while pending:
+                for ref in word.findall(defines[pending.pop()] or ''):
+                    if ref not in names:
+                        names.add(ref)
+                        if ref in defines:
+                            pending.append(ref)
+
+        return tuple(sorted(
+            (name, defines[name]) for name in defines
+            if names is None or name in names or not word.fullmatch(name)
+        ))
+
+    def lexer(self, defines=None, stats=None):
+        """Return a ``Lexer`` of the source, using the stored lexemes."""
+        def scanner():
+            return TableScanner(self.scanner, self.table)
+
+        source = SourceLines(self.lines, self.name)
+        return Lexer(source, scanner=scanner, defines=defines, stats=stats,
+                     **self.kwargs)
+
+    def stream(self, defines=None):
+        """Return the ``TokenStream`` of the source under ``defines``.
+
+        Streams are shared by all macro sets with the same ``key()``.
+        """
+        key = self.key(defines)
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = self.lexer(defines).stream()
+            self.streams[key] = stream
+        return stream
+
+
+class TableScanner(object):
+    """A scanner which reuses the lexemes of previously scanned lines.
+
+    Lexeme and kind lists are shared by every lexer of the table, and must
+    not be modified.
+    """
+    def __init__(self, scanner=Scanner, table=None):
+        self.scanner = scanner()
+        self.table = {} if table is None else table
+        self.prior_delim = None
+        self.kinds = []
+
+    def parse(self, line):
+        """Return the lexemes of a line of Fortran source."""
+        key = (line, self.prior_delim)
+        entry = self.table.get(key)
+        if entry is None:
+            self.scanner.prior_delim = self.prior_delim
+            lexemes = self.scanner.parse(line)
+            entry = (lexemes, self.scanner.kinds, self.scanner.prior_delim)
+            self.table[key] = entry
+
+        lexemes, self.kinds, self.prior_delim = entry
+        return lexemes
+
+
+class SourceLines(object):
+    """An iterator over stored source lines, with the name of the source."""
+    def __init__(self, lines, name=None):
+        self.lines = iter(lines)
+        self.name = name
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return self.__next__()
+
+    def __next__(self):
+        return next(self.lines)
+
+
+def lex_configs(source, configs, scanner=Scanner, **kwargs):
+    """Lex a source under each of several macro configurations.
+
+    ``configs`` is a mapping of configuration names to ``defines``, and the
+    result is an ordered mapping of each name to its ``TokenStream``.  The
+    source is only scanned once.
+    """
+    src = ConfigSource(source, scanner=scanner, **kwargs)
+    return OrderedDict((name, src.stream(defines))
+                       for name, defines in configs.items())
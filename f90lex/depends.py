@@ -0,0 +1,287 @@
+"""f90lex dependency scanning.
+
+``DependencyLexer`` returns only the statements of a source which declare its
+dependencies: ``module``, ``submodule``, ``use`` and ``include``.  It is used
+by build tools which only require the compile order of a set of files.
+
+Most lines are only matched against the dependency keywords by a regular
+expression.  A line is only scanned if it may continue or split a statement
+(i.e. it contains a ``&``, ``;`` or string delimiter), or if it starts a
+dependency statement.  Preprocessing is the same as ``Lexer``, so that
+inactive regions are skipped, and the dependencies of ``#include`` headers are
+returned as part of the source.
+
+``depends_files`` scans a set of files in parallel, and ``depends_graph``
+returns the files which each file depends on.
+
+:copyright: Copyright 2021 Marshall Ward, see AUTHORS for details.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+from collections import namedtuple, OrderedDict
+import re
+
+from f90lex.lexer import Lexer
+from f90lex.project import map_tasks
+from f90lex.scanner import (RegexScanner, NAME, STRING, CONTINUATION,
+                            COMMENT, WHITESPACE, ENDLINE)
+
+# Lines which do not require scanning, and which may start a dependency
+# statement
+plain_line = re.compile(r'[^&;\'"]*$')
+dependency_line = re.compile(r'\s*(module|submodule|use|include)\b', re.I)
+
+dependency_keywords = ('module', 'submodule', 'use', 'include')
+spacing_kinds = frozenset((COMMENT, WHITESPACE, ENDLINE))
+
+# Dependencies of a file: the modules and submodules which it defines, the
+# modules which it uses, and its headers.  Submodules are ``(parent, name)``
+# pairs, where ``parent`` is the ancestor module name or ``ancestor:parent``.
+Dependencies = namedtuple('Dependencies',
+                          ['modules', 'submodules', 'uses', 'includes'])
+
+
+class DependencyLexer(Lexer):
+    """An iterator which returns the dependency statements of a source.
+
+    Each statement is a list of its lexemes, without liminals, and with any
+    macros replaced.  Arguments are the same as ``Lexer``.  The paths of any
+    ``#include`` headers, including nested headers, are stored in
+    ``headers``.
+    """
+    def __init__(self, source, scanner=RegexScanner, **kwargs):
+        # Header paths
+        self.headers = []
+
+        # Lexemes of the current statement, or None if it is not a dependency
+        self.words = None
+
+        # True if the next line continues a statement, and if its first word
+        # may continue the prior word
+        self.continued = False
+        self.split_word = False
+
+        super(DependencyLexer, self).__init__(source, scanner=scanner,
+                                              **kwargs)
+
+    def __next__(self):
+        while True:
+            # Return the statements of any headers
+            while self.includes:
+                try:
+                    return next(self.includes[0])
+                except StopIteration:
+                    self.includes.pop(0)
+
+            # Resume any partially scanned line
+            if self.cache:
+                lexemes, kinds = self.cache, self.cache_kinds
+                start = self.cache_start
+                self.cache = []
+                stmt = self.scan_statement(lexemes, kinds, start)
+                if stmt:
+                    return stmt
+                continue
+
+            line = next(self.source)
+            self.lineno += 1
+
+            if self.stop_parsing:
+                _, line = self.skip_inactive(line)
+                if line is None:
+                    raise StopIteration
+
+            if line[0] == '#':
+                self.preprocess(line.rstrip())
+                continue
+
+            # Skip complete lines which are not dependencies
+            if (not self.continued and plain_line.match(line)
+                    and not dependency_line.match(line)):
+                continue
+
+            lexemes = self.scanner.parse(line)
+            stmt = self.scan_statement(lexemes, self.scanner.kinds, 0)
+            if stmt:
+                return stmt
+
+    def scan_statement(self, lexemes, kinds, start):
+        """Scan lexemes for a dependency statement.
+
+        The statement is returned once it is complete.  If the statement is
+        continued or is not a dependency, then ``None`` is returned.
+        """
+        words = self.words
+        new_stmt = not self.continued
+        self.continued = False
+
+        idx = start
+        while idx < len(lexemes) and kinds[idx] in spacing_kinds:
+            idx += 1
+
+        # Blank and comment lines do not end a continued statement
+        if idx == len(lexemes) and not new_stmt:
+            self.continued = True
+            return None
+
+        # Skip any leading '&', and join any split word
+        if idx < len(lexemes) and kinds[idx] == CONTINUATION:
+            idx += 1
+            if (words and self.split_word and idx < len(lexemes)
+                    and kinds[idx] == NAME):
+                words[-1] += lexemes[idx]
+                idx += 1
+
+        self.split_word = False
+        for idx in range(idx, len(lexemes)):
+            lx = lexemes[idx]
+            kind = kinds[idx]
+            if kind in spacing_kinds:
+                continue
+
+            elif kind == CONTINUATION:
+                self.continued = True
+                # A word directly before '&' may continue on the next line
+                self.split_word = (idx > 0 and kinds[idx - 1] == NAME)
+                self.words = words
+                return None
+
+            elif lx == ';':
+                if words or not new_stmt:
+                    self.cache = lexemes
+                    self.cache_kinds = kinds
+                    self.cache_start = idx + 1
+                    self.words = None
+                    return words
+                continue
+
+            elif new_stmt:
+                new_stmt = False
+                words = [lx] if lx.lower() in dependency_keywords else None
+
+            elif words is not None:
+                if kind == NAME and lx in self.defines:
+                    words.extend(self.defines[lx])
+                elif kind == STRING and self.scanner.prior_delim:
+                    # Strings continued to the next line are not needed
+                    continue
+                else:
+                    words.append(lx)
+
+        self.words = None
+        return words
+
+    def lex_include(self, path):
+        """Return an iterator over the dependency statements of a header."""
+        self.headers.append(path)
+        return self.scan_include(path)
+
+    def scan_include(self, path):
+        with open(path, 'rb' if self.binary else 'r') as inc:
+            lexer = DependencyLexer(inc, scanner=type(self.scanner),
+                                    parent=self)
+            for stmt in lexer:
+                yield stmt
+
+        self.headers.extend(lexer.headers)
+        self.defines.clear()
+        self.defines.update(lexer.defines)
+
+
+def depends(statements, headers=()):
+    """Return the ``Dependencies`` of a sequence of dependency statements."""
+    modules, submodules, uses = [], [], []
+    includes = list(headers)
+
+    for stmt in statements:
+        keyword = stmt[0].lower()
+        names = [w.lower() for w in stmt[1:]]
+
+        if keyword == 'module':
+            # Other statements are module procedures (e.g. `module function`)
+            if len(names) == 1 and is_name(names[0]):
+                modules.append(names[0])
+
+        elif keyword == 'submodule':
+            # submodule (ancestor[:parent]) name
+            if len(names) >= 4 and names[0] == '(' and ')' in names:
+                close = names.index(')')
+                parent = ''.join(names[1:close])
+                if close + 1 < len(names) and is_name(names[close + 1]):
+                    submodules.append((parent, names[close + 1]))
+
+        elif keyword == 'use':
+            # use [[, nature] ::] name [, only: ...]
+            nature = None
+            if names[:1] == [',']:
+                nature = names[1] if len(names) > 1 else None
+                names = names[2:]
+            if names[:1] == ['::']:
+                names = names[1:]
+            if names and is_name(names[0]) and nature != 'intrinsic':
+                uses.append(names[0])
+
+        elif keyword == 'include':
+            if len(stmt) == 2 and stmt[1][:1] in '\'"':
+                includes.append(stmt[1][1:-1])
+
+    return Dependencies(unique(modules), unique(submodules), unique(uses),
+                        unique(includes))
+
+
+def depends_file(path, defines=None, scanner=RegexScanner, include_paths=None):
+    """Return the ``Dependencies`` of a single source file."""
+    with open(path, 'rb') as src:
+        lexer = DependencyLexer(src, scanner=scanner, defines=defines,
+                                include_paths=include_paths)
+        statements = list(lexer)
+    return depends(statements, lexer.headers)
+
+
+def depends_files(paths, jobs=None, defines=None, scanner=RegexScanner,
+                  include_paths=None):
+    """Return the dependencies of a collection of source files.
+
+    Files are scanned in parallel, as in ``lex_files``.  The result is an
+    ordered mapping of each path to its ``Dependencies``.
+    """
+    paths = list(paths)
+    tasks = [(path, defines, scanner, include_paths) for path in paths]
+    return OrderedDict(zip(paths, map_tasks(depends_task, tasks, jobs)))
+
+
+def depends_task(task):
+    return depends_file(*task)
+
+
+def depends_graph(file_depends):
+    """Return the files which each file depends on.
+
+    ``file_depends`` is a mapping of paths to ``Dependencies``, as returned by
+    ``depends_files``.  A file depends on the files which define its used
+    modules, along with the ancestors of its submodules.  Modules which are
+    not defined by any file (e.g. intrinsic modules) are ignored.
+    """
+    providers = {}
+    for path, deps in file_depends.items():
+        for module in deps.modules:
+            providers[module] = path
+        for parent, name in deps.submodules:
+            ancestor = parent.split(':')[0]
+            providers['{}:{}'.format(ancestor, name)] = path
+
+    graph = OrderedDict()
+    for path, deps in file_depends.items():
+        required = list(deps.uses)
+        required.extend(parent for parent, name in deps.submodules)
+        graph[path] = unique(providers[m] for m in required
+                             if m in providers and providers[m] != path)
+    return graph
+
+
+def is_name(word):
+    return word[:1].isalpha() and word.replace('_', 'a').isalnum()
+
+
+def unique(items):
+    """Return the items of a sequence without repetitions, in order."""
+    return list(OrderedDict.fromkeys(items))
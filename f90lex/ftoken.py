@@ -6,10 +6,18 @@ lexeme, but it also contains a ``head`` and ``tail`` which contain the adjacent
 "liminal" tokens.
 
 Equality and hash tests use the case-insensitive forms, like good little
-Fortran tokens.
+Fortran tokens.  Each token stores its case-folded ``key`` when it is created.
+The keys of names and operators are interned in a shared symbol table, so
+that tokens with the same name share a single key (and its cached hash), and
+most comparisons are an identity test.  Literals are not interned, and the
+table holds at most ``max_symbols`` values.
 
 (By "liminal" I mean the whitespace tokens between the semantic tokens.)
 
+Tokens from a ``Lexer`` also record the lexeme ``kind`` from the scanner (e.g.
+``scanner.NAME``), and their source position ``pos`` as a ``(line, column)``
+tuple, or ``None`` if either is unknown.
+
 The PToken is a subclass of Token, which is produced from preprocessing and
 stores its original pre-processed value as ``pp``, which it uses for roundtrip
 parsing output.
@@ -17,7 +25,40 @@ parsing output.
 :copyright: Copyright 2021 Marshall Ward, see AUTHORS for details.
 :license: Apache License, Version 2.0, see LICENSE for details.
 """
+import sys
+
+# Case-folded keys of token values, and the maximum number of values
+# NOTE: String and numeric literals are not added, since they are rarely
+#   repeated.
+symbols = {}
+max_symbols = 2**16
+
+
+def symbol(value):
+    """Return the case-folded key of a token value, interned if a symbol."""
+    key = value.lower()
+    if is_symbol(value) and len(symbols) < max_symbols:
+        key = sys.intern(key)
+        symbols[value] = key
+        symbols[key] = key
+    return key
+
+
+def is_symbol(value):
+    """Return True if a token value is a name or an operator."""
+    first = value[:1]
+    if first == '.':
+        first = value[1:2]
+    return not (first.isdigit() or first in '\'"')
+
+
 class Token(str):
+    # Lexeme kind, as defined in f90lex.scanner
+    kind = None
+
+    # Source line and column of the lexeme (or its first part, if split)
+    pos = None
+
     # NOTE: Immutable types generally need __new__ implementations
     #   (At least that is my understanding...)
     def __new__(cls, value='', *args, **kwargs):
@@ -25,13 +66,23 @@ class Token(str):
         tok.head = []
         tok.tail = []
         tok.split = None
+        tok.key = symbols.get(value) or symbol(value)
         return tok
 
     def __eq__(self, other):
-        return self.lower() == other.lower()
+        if isinstance(other, Token):
+            return self.key is other.key or self.key == other.key
+        key = symbols.get(other)
+        if key is None:
+            key = other.lower()
+        return self.key is key or self.key == key
+
+    def __ne__(self, other):
+        return not self == other
 
     def __hash__(self):
-        return hash(str(self).lower())
+        # Interned keys cache their hash
+        return hash(self.key)
 
 
 class PToken(Token):
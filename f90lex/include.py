@@ -0,0 +1,134 @@
+"""f90lex header inclusion.
+
+``IncludeCache`` holds the lexed statements of ``#include`` headers, so that a
+header which is included by many source files is only lexed once per process.
+
+Each entry is keyed by the path, modification time and size of the header, by
+the directories which are searched for its nested headers, and by the macros
+which are defined when it is included, since these determine the statements
+of the header.  The macros defined after the header are also stored, so that
+the ``#define`` and ``#undef`` directives of a header can be applied to the
+including source.
+
+The statements of any nested headers are stored within the entry of a header,
+so each entry also records the stamps of its nested headers.  An entry is
+removed if any of these headers have changed.
+
+Headers with more than ``max_statements`` statements are not stored, so that
+large headers are lexed as a stream rather than held in memory.  At most
+``max_entries`` headers are stored, and the least recently used header is
+removed when the cache is full.  A cache may be shared by lexers in several
+threads.
+
+:copyright: Copyright 2021 Marshall Ward, see AUTHORS for details.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+from collections import OrderedDict
+import os
+import threading
+
+
+class IncludeCache(object):
+    """A cache of lexed header statements."""
+    def __init__(self, max_statements=4096, max_entries=256):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.max_statements = max_statements
+        self.max_entries = max_entries
+
+    def key(self, path, defines, include_paths=None):
+        """Return the cache key of a header and the current macros.
+
+        Nested headers are searched in ``include_paths`` and the current
+        directory (as well as the directory of the header), so the key
+        includes these directories.
+        """
+        search = tuple(os.path.abspath(idir)
+                       for idir in list(include_paths or []) + [os.curdir])
+        macros = tuple((name, tuple(lexemes))
+                       for name, lexemes in defines.items())
+        return header_stamp(path) + (search, macros)
+
+    def get(self, key):
+        """Return the entry of a header, or ``None``.
+
+        An entry holds the statements, the final macros, and the stamps of the
+        nested headers of a header.  Entries with a changed nested header are
+        removed.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        if any(header_changed(stamp) for stamp in entry[2]):
+            with self.lock:
+                self.entries.pop(key, None)
+            return None
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, statements, defines, headers=()):
+        """Store the statements of a header and the macros following it.
+
+        Statements are stored as lists of lexeme strings.  ``headers`` are
+        the stamps of any nested headers, as returned by ``header_stamp``.
+        """
+        entry = (statements, tuple(defines.items()), tuple(headers))
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def header_stamp(path):
+    """Return the absolute path, modification time and size of a header."""
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+def header_changed(stamp):
+    """Return True if the header of a stamp was modified or removed."""
+    try:
+        return header_stamp(stamp[0]) != stamp
+    except OSError:
+        return True
+
+
+# Default cache, shared by all lexers in a process
+include_cache = IncludeCache()
+
+
+def find_include(fname, source_dir=None, include_paths=None):
+    """Return the path of a header, or ``None`` if it was not found.
+
+    Headers are searched in the directory of the including source, then in
+    ``include_paths`` (as in the ``-I`` flags of a compiler), and finally in
+    the current directory.
+    """
+    if os.path.isabs(fname):
+        return fname if os.path.isfile(fname) else None
+
+    dirs = []
+    if source_dir is not None:
+        dirs.append(source_dir)
+    dirs.extend(include_paths or [])
+    dirs.append(os.curdir)
+
+    for idir in dirs:
+        path = os.path.join(idir, fname)
+        if os.path.isfile(path):
+            return path
+
+    return None
@@ -0,0 +1,301 @@
+"""Incremental f90lex lexing.
+
+``IncrementalLexer`` holds the lexed statements of a source, and updates them
+after an edit to a range of lines.  Only the statements near the edit are
+lexed again:
+
+* Lexing resumes from the last statement which begins on a new line before the
+  edit, using the ``LexerState`` saved at that line.
+
+* Lexing stops once it reaches a line after the edit whose statement and lexer
+  state both match the previous result.  The remaining statements are reused.
+
+The liminal lists shared by the statements at either end of the edit are
+re-linked, so that the result is identical to lexing the new source in full.
+
+The line numbers of the statements after an edit are not updated in place.
+Instead, the statements from ``shift_start`` are ``shift`` lines behind their
+stored line numbers, and the token positions of a statement are updated as it
+is read.  An edit only moves ``shift_start`` (and updates the statements that
+it passes over), so that its cost depends on the distance from the prior edit
+rather than the size of the source.
+
+:copyright: Copyright 2021 Marshall Ward, see AUTHORS for details.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+import bisect
+import io
+
+from f90lex.lexer import Lexer, decode_lines, is_binary
+
+
+class IncrementalLexer(object):
+    """Lexed statements of a source, which can be updated by line edits.
+
+    Any keyword arguments (e.g. ``scanner`` or ``defines``) are passed to each
+    ``Lexer``.
+    """
+    def __init__(self, source, **kwargs):
+        if isinstance(source, str):
+            source = io.StringIO(source)
+        elif is_binary(source):
+            source = decode_lines(source)
+        self.lines = list(source)
+        self.kwargs = kwargs
+
+        # Liminals preceding the first statement
+        self.head = []
+
+        # Statements, along with their first line and the lexer state at the
+        # start of that line (if lexing can be resumed from that line).
+        # Header statements from #include use the first line of the prior
+        # statement, in order to keep ``firsts`` sorted.
+        self.stmts = []
+        self.stmt_firsts = []
+        self.stmt_states = []
+
+        # Pending line shift of the statements from ``shift_start``
+        self.shift_start = 0
+        self.shift = 0
+
+        # First line of each statement when its token positions were set
+        self.pos_firsts = []
+
+        lexer = Lexer(iter(self.lines), **self.kwargs)
+        self.head = lexer.prior_tail
+        self.stmts, self.stmt_firsts, self.stmt_states = self.relex(lexer)
+        self.pos_firsts = list(self.stmt_firsts)
+
+    @property
+    def text(self):
+        return ''.join(self.lines)
+
+    @property
+    def statements(self):
+        """The statements, as a sequence which updates token positions."""
+        return StatementView(self)
+
+    @property
+    def firsts(self):
+        """The first line of each statement."""
+        start = self.shift_start
+        return (self.stmt_firsts[:start]
+                + [first + self.shift for first in self.stmt_firsts[start:]])
+
+    @property
+    def states(self):
+        """The resume state of each statement (or ``None``)."""
+        return [self.state(idx) for idx in range(len(self.stmt_states))]
+
+    def first(self, idx):
+        """Return the first line of statement ``idx``."""
+        first = self.stmt_firsts[idx]
+        return first + self.shift if idx >= self.shift_start else first
+
+    def state(self, idx):
+        """Return the resume state of statement ``idx`` (or ``None``)."""
+        state = self.stmt_states[idx]
+        if state and self.shift and idx >= self.shift_start:
+            state = state._replace(lineno=state.lineno + self.shift)
+        return state
+
+    def statement(self, idx):
+        """Return statement ``idx``, and update its token positions."""
+        stmt = self.stmts[idx]
+        first = self.first(idx)
+        delta = first - self.pos_firsts[idx]
+        if delta:
+            for tok in stmt:
+                if tok.pos:
+                    tok.pos = (tok.pos[0] + delta, tok.pos[1])
+            self.pos_firsts[idx] = first
+        return stmt
+
+    def find_first(self, line, right=False):
+        """Return the bisection index of ``line`` in the first lines."""
+        find = bisect.bisect_right if right else bisect.bisect_left
+        start = self.shift_start
+        idx = find(self.stmt_firsts, line, 0, start)
+        if idx == start:
+            idx = find(self.stmt_firsts, line - self.shift, start)
+        return idx
+
+    def move_shift(self, start):
+        """Move the start of the pending line shift to statement ``start``.
+
+        The line numbers of the statements between the old and new start are
+        updated, so that the line numbers of every statement are unchanged.
+        """
+        if start > self.shift_start:
+            self.shift_lines(self.shift_start, start, self.shift)
+        elif start < self.shift_start:
+            self.shift_lines(start, self.shift_start, -self.shift)
+        self.shift_start = start
+
+    def shift_lines(self, start, end, delta):
+        """Shift the stored line numbers of statements ``start`` to ``end``."""
+        if not delta:
+            return
+        for idx in range(start, end):
+            self.stmt_firsts[idx] += delta
+            state = self.stmt_states[idx]
+            if state:
+                self.stmt_states[idx] = state._replace(
+                    lineno=state.lineno + delta
+                )
+
+    def edit(self, start, end, text):
+        """Replace lines ``start`` to ``end`` (from zero, exclusive) by text.
+
+        If ``text`` does not end with an endline, then it is joined to the
+        line following the edit.  The return value is a tuple ``(first,
+        old_end, new_end)``, where statements ``first`` to ``old_end`` of the
+        old result were replaced by statements ``first`` to ``new_end``.
+        """
+        new_lines = io.StringIO(text).readlines()
+        if new_lines and not new_lines[-1].endswith('\n') \
+                and end < len(self.lines):
+            new_lines[-1] += self.lines[end]
+            end += 1
+
+        self.lines[start:end] = new_lines
+        delta = len(new_lines) - (end - start)
+
+        # Find a statement before the edit (in 1-based lines) to resume from
+        k = self.find_first(start + 1, right=True) - 1
+        while k > 0 and self.stmt_states[k] is None:
+            k -= 1
+
+        if k > 0:
+            state = self.state(k)
+            lines = (self.lines[i]
+                     for i in range(state.lineno, len(self.lines)))
+            lexer = Lexer(lines, state=state, **self.kwargs)
+
+            # Replace liminals of the resumed line in the shared tail
+            tail = self.stmts[k][0].head
+            cut = line_start(tail)
+            resumed_lims = tail[cut:]
+            tail[cut:] = lexer.prior_tail
+            lexer.prior_tail = tail
+        else:
+            k = 0
+            resumed_lims = None
+            lexer = Lexer(iter(self.lines), **self.kwargs)
+            self.head = lexer.prior_tail
+
+        stmts, firsts, states = self.relex(lexer, start + len(new_lines),
+                                           delta, k)
+
+        # Reuse the old statements following a matching state
+        old_end = len(self.stmts)
+        if states and states[-1] is not None and len(states) > len(stmts):
+            state = states.pop()
+            firsts.pop()
+            old_end = self.find_first(state.lineno + 1 - delta)
+
+            # Link the new tail to the old statements.  Liminals of the
+            # matching line (e.g. a leading ``&``) are taken from the old head.
+            if old_end == k and resumed_lims is not None:
+                lims = resumed_lims
+            else:
+                head = self.stmts[old_end][0].head
+                lims = head[line_start(head):]
+            tail = lexer.prior_tail
+            tail[line_start(tail):] = lims
+            self.stmts[old_end][0].head = tail
+
+        # Shift the line numbers of the old statements after the edit
+        self.move_shift(old_end)
+        self.shift += delta
+
+        self.stmts[k:old_end] = stmts
+        self.stmt_firsts[k:old_end] = firsts
+        self.stmt_states[k:old_end] = states
+        self.pos_firsts[k:old_end] = firsts
+        self.shift_start = k + len(stmts)
+
+        return k, old_end, k + len(stmts)
+
+    def relex(self, lexer, edit_end=None, delta=0, k=0):
+        """Lex statements, stopping at a state which matches the old result.
+
+        Returns the new statements, their first lines, and their resume
+        states.  If the old result was matched, then the matching state (and
+        its first line) is appended to the lists.
+        """
+        stmts, firsts, states = [], [], []
+
+        prior_last = 0
+        while True:
+            # A resumable line starts a statement on a new line, without any
+            # pending header statements.
+            state = None
+            if not lexer.includes and lexer.lineno > prior_last:
+                state = lexer.state()
+
+            # Stop if the old statements can be reused (after at least one
+            # statement, since the resumed line's liminals were replaced)
+            if (state and stmts and edit_end is not None
+                    and state.lineno >= edit_end):
+                old_line = state.lineno + 1 - delta
+                o = self.find_first(old_line)
+                if (o < len(self.stmts) and o >= k
+                        and self.first(o) == old_line
+                        and self.stmt_states[o] is not None
+                        and self.stmt_states[o][1:] == state[1:]):
+                    states.append(state)
+                    firsts.append(state.lineno + 1)
+                    break
+
+            try:
+                stmt = next(lexer)
+            except StopIteration:
+                break
+
+            if lexer.span:
+                prior_last = lexer.span[1]
+                firsts.append(lexer.span[0])
+            else:
+                state = None
+                if firsts:
+                    firsts.append(firsts[-1])
+                else:
+                    firsts.append(self.first(k - 1) if k > 0 else 0)
+            stmts.append(stmt)
+            states.append(state)
+
+        return stmts, firsts, states
+
+
+def line_start(lims):
+    """Return the index of the first liminal of the final line."""
+    idx = len(lims)
+    while idx > 0 and not lims[idx - 1].endswith('\n'):
+        idx -= 1
+    return idx
+
+
+class StatementView(object):
+    """The statements of an ``IncrementalLexer``, as a sequence.
+
+    Token positions of each statement are updated as it is read.
+    """
+    def __init__(self, lexer):
+        self.lexer = lexer
+
+    def __len__(self):
+        return len(self.lexer.stmts)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self.lexer.statement(idx)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('statement index out of range')
+        return self.lexer.statement(idx)
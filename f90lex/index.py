@@ -0,0 +1,273 @@
+"""f90lex statement index.
+
+``StatementIndex`` records the first and last lines of each statement of a
+source file, along with a set of resume points: the byte offset and
+``LexerState`` of the lines from which lexing can be resumed (as in
+``IncrementalLexer``).  Once an index is built, any statement or range of
+lines can be lexed by seeking to the nearest resume point, rather than lexing
+the source from the start.
+
+Statements which cannot be resumed (e.g. following a ``;`` or from an
+``#include`` header) are lexed from the nearest prior resume point.
+
+An index can be saved alongside its source, and is only loaded if the source
+file (by its size and modification time), its ``#include`` headers, and the
+lexer settings are unchanged.
+Note that the first statement of a resumed lexer only includes the leading
+liminals of its own line.
+
+:copyright: Copyright 2021 Marshall Ward, see AUTHORS for details.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+import bisect
+import io
+import itertools
+import json
+import os
+
+import f90lex
+from f90lex.include import header_changed
+from f90lex.lexer import Lexer, LexerState
+from f90lex.scanner import Scanner
+
+
+class StatementIndex(object):
+    """The lines and resume points of the statements of a file."""
+
+    suffix = '.f90idx'
+
+    def __init__(self, path, defines=None, scanner=Scanner,
+                 include_paths=None, encoding=None):
+        self.path = path
+        self.defines = dict(defines or {})
+        self.scanner = scanner
+        self.include_paths = list(include_paths or [])
+        self.encoding = encoding
+
+        # Size and modification time of the indexed source, and the stamps of
+        # its headers (see include.header_stamp)
+        self.stamp = None
+        self.headers = []
+
+        # First and last line of each statement.  Header statements use the
+        # lines of the prior statement, in order to keep the lines sorted.
+        self.firsts = []
+        self.lasts = []
+
+        # Resume points: statement, number of preceding lines, byte offset of
+        # the line, and an index of the point's state in ``states``
+        self.points = []
+
+        # Distinct lexer states of the resume points, as (defines,
+        # stop_parsing, branch_taken)
+        self.states = []
+
+    @classmethod
+    def build(cls, path, defines=None, scanner=Scanner, include_paths=None,
+              encoding=None):
+        """Lex a source file and index its statements."""
+        index = cls(path, defines, scanner, include_paths, encoding)
+        index.stamp = file_stamp(path)
+
+        with open(path, 'rb') as f:
+            offsets = line_offsets(f)
+
+        state_ids = {}
+        with index.open(0) as src:
+            lexer = Lexer(src, scanner=scanner, defines=defines,
+                          include_paths=include_paths)
+            prior_last = 0
+            for stmt_idx in itertools.count():
+                # See IncrementalLexer.relex for resumable lines
+                state = None
+                if not lexer.includes and lexer.lineno > prior_last:
+                    state = lexer.state()
+
+                try:
+                    next(lexer)
+                except StopIteration:
+                    break
+
+                if state:
+                    defines = tuple((name, tuple(lexemes))
+                                    for name, lexemes in state.defines)
+                    key = (defines, state.stop_parsing, state.branch_taken)
+                    if key not in state_ids:
+                        state_ids[key] = len(index.states)
+                        index.states.append(key)
+                    index.points.append((stmt_idx, state.lineno,
+                                         offsets[state.lineno],
+                                         state_ids[key]))
+
+                if lexer.span:
+                    first, prior_last = lexer.span
+                elif index.firsts:
+                    first, prior_last = index.firsts[-1], index.lasts[-1]
+                else:
+                    first, prior_last = 0, 0
+                index.firsts.append(first)
+                index.lasts.append(prior_last)
+
+            index.headers = list(lexer.include_stamps)
+
+        return index
+
+    def __len__(self):
+        return len(self.firsts)
+
+    def open(self, offset=0):
+        """Return the source file, from a byte offset.
+
+        The file is binary, and is decoded as in ``Lexer``, unless the index
+        has an ``encoding``.
+        """
+        f = open(self.path, 'rb')
+        f.seek(offset)
+        if self.encoding is None:
+            return f
+        return io.TextIOWrapper(f, encoding=self.encoding,
+                                errors='surrogateescape')
+
+    def resume_point(self, stmt_idx):
+        """Return the last resume point at or before a statement.
+
+        ``None`` is returned if the statement must be lexed from the start of
+        the source.
+        """
+        p = bisect.bisect_right(self.points, (stmt_idx, float('inf'))) - 1
+        return self.points[p] if p >= 0 else None
+
+    def statements(self, start, stop=None):
+        """Generate statements ``start`` to ``stop`` (from zero, exclusive)."""
+        if stop is None:
+            stop = len(self)
+
+        point = self.resume_point(start)
+        if point:
+            stmt_idx, lineno, offset, state_idx = point
+            state = LexerState(lineno, *self.states[state_idx])
+            kwargs = {'state': state}
+        else:
+            stmt_idx, offset = 0, 0
+            kwargs = {'defines': self.defines}
+
+        with self.open(offset) as src:
+            lexer = Lexer(src, scanner=self.scanner,
+                          include_paths=self.include_paths, **kwargs)
+            for stmt in lexer:
+                if stmt_idx >= stop:
+                    break
+                if stmt_idx >= start:
+                    yield stmt
+                stmt_idx += 1
+
+    def lines(self, first, last):
+        """Return the statements which overlap lines ``first`` to ``last``.
+
+        Lines are numbered from one, and ``last`` is included.
+        """
+        start = bisect.bisect_left(self.lasts, first)
+        stop = bisect.bisect_right(self.firsts, last)
+        return list(self.statements(start, stop))
+
+    def save(self, path=None):
+        """Save the index as JSON, by default alongside its source."""
+        if path is None:
+            path = self.path + StatementIndex.suffix
+
+        data = {
+            'version': f90lex.__version__,
+            'settings': self.settings(),
+            'stamp': self.stamp,
+            'headers': self.headers,
+            'firsts': self.firsts,
+            'lasts': self.lasts,
+            'points': self.points,
+            'states': self.states,
+        }
+        with open(path, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path, defines=None, scanner=Scanner, include_paths=None,
+             encoding=None, index_path=None):
+        """Load the saved index of a source, or return ``None``.
+
+        ``None`` is also returned if the source, its headers, or the lexer
+        settings differ from those of the saved index.
+        """
+        if index_path is None:
+            index_path = path + StatementIndex.suffix
+
+        index = cls(path, defines, scanner, include_paths, encoding)
+        try:
+            with open(index_path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+        try:
+            stamp = file_stamp(path)
+        except OSError:
+            return None
+
+        if (data.get('version') != f90lex.__version__
+                or data['settings'] != index.settings()
+                or data['stamp'] != list(stamp)):
+            return None
+
+        # NOTE: Indexes saved without headers cannot be checked
+        if 'headers' not in data:
+            return None
+        headers = [tuple(header) for header in data['headers']]
+        if any(header_changed(header) for header in headers):
+            return None
+
+        index.stamp = stamp
+        index.headers = headers
+        index.firsts = data['firsts']
+        index.lasts = data['lasts']
+        index.points = [tuple(p) for p in data['points']]
+        index.states = [
+            (tuple((name, tuple(lexemes)) for name, lexemes in state[0]),)
+            + tuple(state[1:])
+            for state in data['states']
+        ]
+        return index
+
+    def settings(self):
+        """Return the lexer settings of the index, as stored in JSON."""
+        return {
+            'defines': sorted([name, replacement] for name, replacement
+                              in self.defines.items()),
+            'scanner': self.scanner.__name__,
+            'include_paths': self.include_paths,
+            'encoding': self.encoding,
+        }
+
+
+def statement_index(path, index_path=None, **kwargs):
+    """Return the statement index of a source file.
+
+    A saved index is used if it is current, otherwise the index is built and
+    saved to ``index_path`` (by default, alongside the source).  Keyword
+    arguments are passed to ``StatementIndex.build``.
+    """
+    index = StatementIndex.load(path, index_path=index_path, **kwargs)
+    if index is None:
+        index = StatementIndex.build(path, **kwargs)
+        index.save(index_path)
+    return index
+
+
+def file_stamp(path):
+    st = os.stat(path)
+    return (st.st_size, st.st_mtime_ns)
+
+
+def line_offsets(f):
+    """Return the byte offset of the start of each line of a binary file."""
+    offsets = [0]
+    for line in f:
+        offsets.append(offsets[-1] + len(line))
+    return offsets
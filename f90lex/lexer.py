@@ -3,47 +3,150 @@
 ``Lexer`` is an iterator which is initalized by an input stream (usually a
 file) and each iteration returns the next complete Fortran statement.
 
+Binary streams (e.g. files opened with ``'rb'``) are decoded one line at a
+time as UTF-8.  Bytes which are not UTF-8 (e.g. Latin-1 comments) are decoded
+as surrogate escapes, so that the source can be reproduced by encoding the
+rendered text with ``errors='surrogateescape'``.  Endlines are translated as
+in text-mode files.
+
 :copyright: Copyright 2021 Marshall Ward, see AUTHORS for details.
 :license: Apache License, Version 2.0, see LICENSE for details.
 """
-from collections import OrderedDict
+from collections import namedtuple, OrderedDict
+import functools
+import io
 import itertools
+import os
+import re
 
-from f90lex.scanner import Scanner
+from f90lex import condition, include
+from f90lex.scanner import (Scanner, lexeme_kind, NAME, STRING, COMMENT,
+                            DIRECTIVE, WHITESPACE, CONTINUATION, ENDLINE)
 from f90lex.ftoken import Token, PToken
+from f90lex.stats import LexerStats
+from f90lex.stream import TokenStream
+
+
+# Lexer state at the start of a source line
+LexerState = namedtuple('LexerState', ['lineno', 'defines', 'stop_parsing',
+                                       'branch_taken'])
+LexerState.__new__.__defaults__ = (False,)
 
 
 class Lexer(object):
-    """An iterator which returns the lexemes from an input stream."""
-    def __init__(self, source):
-        self.source = source
+    """An iterator which returns the lexemes from an input stream.
+
+    The ``scanner`` argument selects the lexeme scanner engine, either
+    ``Scanner`` (the default) or ``RegexScanner``.  Initial preprocessor
+    macros may be provided as a ``defines`` mapping of names to replacement
+    text, as in the ``-D`` flags of a compiler.
+
+    A ``LexerState``, as returned by ``state()``, may be used to resume lexing
+    from the start of a line of a source.  In this case, ``source`` should
+    begin at the line following ``state.lineno``.
+
+    Headers of ``#include`` directives are searched in the directory of
+    ``source`` (if it has a ``name``), then in ``include_paths``, and then in
+    the current directory.  Header statements are lexed by a nested lexer as
+    they are returned, and the macros of a header are applied once all of its
+    statements are returned.  Lexed headers are stored in ``include_cache``,
+    which by default is shared by all lexers.  A ``parent`` lexer provides
+    the initial macros and include settings of a header.  The stamps of all
+    included headers (see ``include.header_stamp``) are stored in
+    ``include_stamps``.
+
+    Conditional directives (``#ifdef``, ``#ifndef``, ``#if``, ``#elif``,
+    ``#else`` and ``#endif``) are evaluated, and the lines of inactive
+    branches are stored as liminals.  The expressions of ``#if`` and
+    ``#elif`` are evaluated as in ``f90lex.condition``.
+
+    Each token records its position in the source as ``pos``, a tuple of its
+    line and column (both from 1).  Columns are counted in characters of the
+    decoded line.
+
+    If ``stats`` is ``True`` (or a ``LexerStats`` object), then the time
+    spent in each phase of lexing and the counts of tokens are recorded in
+    ``self.stats``.
+    """
+    def __init__(self, source, scanner=Scanner, defines=None, state=None,
+                 include_paths=None, include_cache=None, parent=None,
+                 stats=None):
+        self.name = name = getattr(source, 'name', None)
+        self.binary = is_binary(source)
+        self.source = decode_lines(source) if self.binary else source
+
+        # Header search paths
+        self.source_dir = (os.path.dirname(name) or os.curdir
+                           if isinstance(name, str) else None)
+        if parent and include_paths is None:
+            include_paths = parent.include_paths
+        if parent and include_cache is None:
+            include_cache = parent.include_cache
+        self.include_paths = list(include_paths or [])
+        self.include_cache = (include_cache if include_cache is not None
+                              else include.include_cache)
+
+        # Number of lines read from the source, and the first and last line
+        # of the most recent statement (or None for #include statements)
+        self.lineno = 0
+        self.span = None
 
         # A reuseable Lexeme scanner
-        self.scanner = Scanner()
+        self.scanner = scanner()
+
+        # Token resplitting function, with its own scanner
+        self.resplit_scanner = Scanner()
+        self.resplit = functools.partial(resplit_tokens,
+                                         scanner=self.resplit_scanner)
+
+        # Optional profiling
+        if stats is True:
+            stats = LexerStats()
+        self.stats = stats
+        if stats:
+            stats.instrument(self)
 
-        # Cached statements from preprocessed headers
+        # Statement iterators of pending headers
         self.includes = []
 
-        # Split line cache
+        # Stamps of the included headers, including nested headers
+        self.include_stamps = []
+
+        # Split line cache, its lexeme kinds and columns, and the index of its
+        # first lexeme
         self.cache = []
+        self.cache_kinds = []
+        self.cache_columns = None
+        self.cache_start = 0
 
         # Preprocessor macros
         # NOTE: Macros are applied in order of #define, so use OrderedDict
         self.defines = OrderedDict()
+        if parent:
+            self.defines.update(parent.defines)
+        if defines:
+            for name, replacement in defines.items():
+                self.define(name, replacement)
 
         # Parser flow control
         # XXX: This probably does not need to be an object property, and
         #   could be returned from preprocess() to get_liminals()
         self.stop_parsing = False
 
+        # True if a branch of the current inactive conditional was active
+        # NOTE: If parsing is active, then every enclosing conditional is in
+        #   its active branch, so no stack of conditionals is needed.
+        self.branch_taken = False
+
+        if state:
+            self.lineno = state.lineno
+            self.defines.update(state.defines)
+            self.stop_parsing = state.stop_parsing
+            self.branch_taken = state.branch_taken
+
         # Gather leading liminal tokens before iteration
         self.prior_tail = self.get_liminals()
 
-        # Preprocess the liminals preceding the first statement
-        preproc = (lx for lx in self.prior_tail if lx[0] == '#')
-        for pp in preproc:
-            self.preprocess(pp)
-
     def __iter__(self):
         return self
 
@@ -51,17 +154,44 @@ class Lexer(object):
         return self.__next__()
 
     def __next__(self):
-        # Return `#include` statments if cached, and exit immediately
-        if self.includes:
-            inc_stmt = self.includes.pop()
+        # Return `#include` statements if pending, and exit immediately
+        while self.includes:
+            try:
+                inc_stmt = next(self.includes[0])
+            except StopIteration:
+                self.includes.pop(0)
+
+                # Resume the liminals following the final header
+                if not self.includes and not self.cache:
+                    self.prior_tail.extend(self.get_liminals())
+                continue
+
             # Strip the statement of liminals and display strings
-            statement = [PToken(str(tok), pp='') for tok in inc_stmt]
+            statement = []
+            for lx in inc_stmt:
+                ptok = PToken(lx, pp='')
+                ptok.kind = lexeme_kind(lx)
+                statement.append(ptok)
+
+            # Link the statement to the liminals, which may yet be extended
+            if statement:
+                statement[0].head = self.prior_tail
+                self.prior_tail = statement[-1].tail
+
+            self.span = None
             return statement
 
         # If no self.includes, tokenize as usual
         prior_tail = self.prior_tail
         statement = []
         line_continue = True
+        first_line = None
+
+        # Parts of a token which is split across lines, which are joined
+        # after the final line of the token
+        split_values = None
+        split_context = split_kind = None
+        string_open = False
 
         while line_continue:
             line_continue = False
@@ -69,7 +199,10 @@ class Lexer(object):
             # Gather lexemes for the next statement
             if self.cache:
                 lexemes = self.cache
+                kinds = self.cache_kinds
+                start = self.cache_start
                 self.cache = []
+                columns = self.cache_columns
             else:
                 # NOTE: This can only happen on the final iteration.
                 #   This is because we call get_liminals() at __init__(), and
@@ -80,126 +213,348 @@ class Lexer(object):
                 #
                 # In all conceivable cases, next(source) raises StopIteration.
                 # But for now, I will leave this in case of the unforeseen.
-
-                # Preprocessing
-                # XXX: Preprocessing has an "head-tail" problem, where we need
-                #   to resolve both before and after each iteration.
-                #   Here we are preprocessing the final liminal tail
-                preproc = (lx for lx in self.prior_tail if lx[0] == '#')
-                for pp in preproc:
-                    self.preprocess(pp)
-
+                #
+                # NOTE: Directives of the liminals were already preprocessed
+                #   by get_liminals().
                 line = next(self.source)
+                self.lineno += 1
                 lexemes = self.scanner.parse(line)
+                kinds = self.scanner.kinds
+                start = 0
+                columns = None
+
+            if first_line is None:
+                first_line = self.lineno
+
+            # Column of each lexeme, counted from 1
+            if columns is None:
+                columns = lexeme_columns(lexemes)
+            lineno = self.lineno
 
             # Reconstruct any line continuations
-            if lexemes[0] == '&':
-                # First check if the split is separated by whitespace
-                lx_split = prior_tail[0].isspace() or lexemes[1].isspace()
+            if kinds[start] == CONTINUATION:
+                second = lexemes[start + 1]
 
-                # If no separating whitespace, try to split via Scanner
-                if not lx_split:
-                    new_lx = resplit_tokens(statement[-1], lexemes[1])
-                    lx_split = len(new_lx) > 1
+                # First check if the split is separated by whitespace
+                lx_split = prior_tail[0].isspace() or second.isspace()
+
+                # Strings which were open at the prior line are continued.
+                # Otherwise, check if the tokens can be split.
+                # NOTE: The parts of a split token are only joined once the
+                #   token is complete.  Until then, only the kind of the token
+                #   and its digit-compacted text are used to test a split.
+                if not lx_split and not string_open:
+                    if split_values:
+                        first = split_context
+                        first_kind = split_kind
+                    else:
+                        first = str.__str__(statement[-1])
+                        first_kind = statement[-1].kind
+
+                    if first[0] in '\'"':
+                        # Adjacent strings are joined by an escaped delimiter
+                        lx_split = second[0] != first[0]
+                    elif first_kind == NAME:
+                        lx_split = not is_name_part(second)
+                    else:
+                        new_lx = self.resplit(first, second)
+                        lx_split = len(new_lx) > 1
 
                 # The token has been split, try to reconstruct it here.
                 if not lx_split:
-                    stok = statement[-1]
-                    tok = Token(''.join(new_lx[:2]))
-
-                    tok.head = stok.head
+                    if not split_values:
+                        stok = statement[-1]
+                        split_values = [str.__str__(stok)]
+                        split_context = split_values[0]
+                        split_texts = [stok.split if stok.split
+                                       else str(stok)]
+                        split_head = stok.head
+                        split_kind = stok.kind
+                        split_pos = stok.pos
 
                     # Set up the interior liminal tokens (what a paradox!)
                     prior_tail.append('&')
 
-                    sp = stok.split if stok.split else str(stok)
-                    sp = sp + ''.join(prior_tail) + lexemes[1]
-                    tok.split = sp
-                    prior_tail = []
+                    split_values.append(second)
+                    if split_kind not in (NAME, STRING):
+                        split_context = digit_runs('0',
+                                                   split_context + second)
+                    split_texts.extend(prior_tail)
+                    split_texts.append(second)
 
                     # Currently empty, but may be filled after iteration
-                    tok.tail = prior_tail
+                    prior_tail = []
+                    split_tail = prior_tail
 
-                    # Assign the new reconstructed token
-                    statement[-1] = tok
-                    lexemes = lexemes[2:]
+                    start += 2
                 else:
                     # Store '&' as liminal and proceed as normal
                     prior_tail.append('&')
-                    lexemes = lexemes[1:]
+                    start += 1
 
             # Build tokens from lexemes
-            for lx in lexemes:
-                if lx.isspace() or lx[0] == '!':
+            for idx in range(start, len(lexemes)):
+                lx = lexemes[idx]
+                kind = kinds[idx]
+                if kind in spacing_kinds:
                     prior_tail.append(lx)
 
                 elif lx == ';':
                     # Pull liminals and semicolons from the line
-                    idx = lexemes.index(';')
-                    for lxm in lexemes[idx:]:
-                        # NOTE: Line continuations after ; are liminals
-                        if is_liminal(lxm) or lxm == '&':
-                            prior_tail.append(lxm)
-                            idx += 1
-                        else:
-                            break
-
-                    self.cache = lexemes[idx:]
+                    # NOTE: Line continuations after ; are liminals
+                    while idx < len(lexemes) and (
+                            kinds[idx] in liminal_kinds
+                            or lexemes[idx] == ';'
+                            or kinds[idx] == CONTINUATION):
+                        prior_tail.append(lexemes[idx])
+                        idx += 1
+
+                    if idx < len(lexemes):
+                        self.cache = lexemes
+                        self.cache_kinds = kinds
+                        self.cache_start = idx
+                        self.cache_columns = columns
                     self.prior_tail = prior_tail
                     break
 
-                elif lx == '&':
-                    idx = lexemes.index('&')
-                    prior_tail += lexemes[idx:] + self.get_liminals()
+                elif kind == CONTINUATION:
+                    string_open = self.scanner.prior_delim is not None
+                    prior_tail.extend(lexemes[idx:])
+                    prior_tail.extend(self.get_liminals(continued=True))
                     line_continue = True
                     break
 
                 else:
+                    # Complete any split token
+                    if split_values:
+                        statement[-1] = join_split(split_values, split_texts,
+                                                   split_head, split_tail,
+                                                   split_kind, split_pos)
+                        split_values = None
+
                     # NOTE: This is probably happening later than it should;
                     #   Preprocessing is handled in liminals!
                     if lx in self.defines:
-                        ptoks = [PToken(lxm) for lxm in self.defines[lx]]
+                        ptoks = self.expand(lx)
                         ptoks[0].head = prior_tail
                         prior_tail = ptoks[-1].tail
-                        ptoks[0].pp = lx
+
+                        # Macro tokens are located at the macro name
+                        pos = (lineno, columns[idx])
+                        for ptok in ptoks:
+                            ptok.pos = pos
 
                         statement.extend(ptoks)
                     else:
                         tok = Token(lx)
                         tok.head = prior_tail
+                        tok.kind = kind
+                        tok.pos = (lineno, columns[idx])
 
                         statement.append(tok)
                         prior_tail = tok.tail
 
+        if split_values:
+            statement[-1] = join_split(split_values, split_texts, split_head,
+                                       split_tail, split_kind, split_pos)
+
+        self.span = (first_line, self.lineno)
+
         if not self.cache:
             statement[-1].tail.extend(self.get_liminals())
             self.prior_tail = statement[-1].tail
 
+        if self.stats:
+            self.stats.statement(statement, self.span)
+
         return statement
 
-    def get_liminals(self):
+    def state(self):
+        """Return the lexer state at the start of the next statement's line.
+
+        This state may only be used to resume lexing if the next statement
+        begins on a new line (i.e. it does not follow a ``;``) and there are
+        no pending ``#include`` statements.
+        """
+        lineno = self.lineno - 1 if self.cache else self.lineno
+        return LexerState(lineno, tuple(self.defines.items()),
+                          self.stop_parsing, self.branch_taken)
+
+    def stream(self):
+        """Return the remaining statements as a compact ``TokenStream``."""
+        return TokenStream.from_lexer(self)
+
+    def get_liminals(self, continued=False):
+        """Return the liminals up to the next statement, and preprocess them.
+
+        Gathering stops after an ``#include`` directive, so that the header
+        statements (and macros) precede any subsequent lines.  If
+        ``continued``, then the liminals are within a continued statement,
+        and headers are instead read in full before gathering resumes.
+
+        Lines which only contain liminals are split by ``liminal_line``,
+        rather than the scanner.
+        """
         lims = []
         for line in self.source:
-            lexemes = self.scanner.parse(line)
+            self.lineno += 1
+
+            # Inactive lines are stored as a single liminal
+            if self.stop_parsing:
+                span, line = self.skip_inactive(line)
+                if span:
+                    lims.append(span)
+                if line is None:
+                    break
+
+            # Blank, comment and directive lines are split without a scan
+            match = liminal_line(line)
+            if match:
+                lexemes = [lx for lx in match.groups() if lx]
+                idx = len(lexemes)
+                lims.extend(lexemes)
+                is_directive = line[0] == '#'
+            else:
+                lexemes = self.scanner.parse(line)
+                kinds = self.scanner.kinds
 
-            new_lims = list(itertools.takewhile(is_liminal, lexemes))
-            lims += new_lims
+                idx = 0
+                while idx < len(lexemes) and (kinds[idx] in liminal_kinds
+                                              or lexemes[idx] == ';'):
+                    idx += 1
+                lims.extend(lexemes[:idx])
+                is_directive = idx and kinds[0] == DIRECTIVE
 
             # Apply preprocessing to set up subsequent statements
-            if new_lims and new_lims[0][0] == '#':
-                self.preprocess(new_lims[0])
+            if is_directive:
+                n_includes = len(self.includes)
+                self.preprocess(lexemes[0])
+
+                if len(self.includes) > n_includes:
+                    if not continued:
+                        break
+                    self.includes[-1] = iter(list(self.includes[-1]))
 
             # Statements are liminals if preprocessing has suspended parsing
-            stmt = list(itertools.dropwhile(is_liminal, lexemes))
             if self.stop_parsing:
-                lims += stmt
-            else:
-                self.cache = stmt
-                if self.cache:
-                    break
+                lims.extend(lexemes[idx:])
+            elif idx < len(lexemes):
+                self.cache = lexemes
+                self.cache_kinds = kinds
+                self.cache_columns = None
+                self.cache_start = idx
+                break
 
         return lims
 
+    def skip_inactive(self, line):
+        """Return the inactive lines from ``line``, and the line ending them.
+
+        Lines are only checked for conditional directives, and any nested
+        conditionals are skipped.  The region is ended by an ``#else``,
+        ``#elif`` or ``#endif`` line, or ``None`` at the end of the source.
+        """
+        lines = []
+        depth = 0
+        while line is not None:
+            if line[0] == '#':
+                directive = directive_name.match(line).group(1)
+                if directive in ('if', 'ifdef', 'ifndef'):
+                    depth += 1
+                elif directive in ('else', 'elif', 'endif') and depth == 0:
+                    break
+                elif directive == 'endif':
+                    depth -= 1
+
+            lines.append(line)
+            line = next(self.source, None)
+            if line is not None:
+                self.lineno += 1
+
+        return ''.join(lines), line
+
+    def lex_include(self, path):
+        """Return an iterator over the statements of a header.
+
+        Statements are lists of lexeme strings, and are reused from the
+        include cache if the header was previously lexed with the same macros.
+        The macros of the header are applied after its final statement.
+        """
+        key = self.include_cache.key(path, self.defines, self.include_paths)
+        entry = self.include_cache.get(key)
+        if entry is None:
+            return self.stream_include(path, key)
+
+        statements, defines, headers = entry
+        self.include_stamps.append(key[:3])
+        self.include_stamps.extend(headers)
+        return self.cached_include(statements, defines)
+
+    def stream_include(self, path, key):
+        # Lex the header as its statements are read, and store it in the cache
+        # if it is not too large.
+        statements = []
+        max_statements = self.include_cache.max_statements
+        with open(path, 'rb' if self.binary else 'r') as inc:
+            lexer = Lexer(inc, scanner=type(self.scanner), parent=self)
+            for stmt in lexer:
+                values = [str.__str__(tok) for tok in stmt]
+                if statements is not None:
+                    statements.append(values)
+                    if len(statements) > max_statements:
+                        statements = None
+                yield values
+
+        if statements is not None:
+            self.include_cache.put(key, statements, lexer.defines,
+                                   lexer.include_stamps)
+
+        self.include_stamps.append(key[:3])
+        self.include_stamps.extend(lexer.include_stamps)
+        self.defines.clear()
+        self.defines.update(lexer.defines)
+
+    def cached_include(self, statements, defines):
+        for stmt in statements:
+            yield stmt
+
+        self.defines.clear()
+        self.defines.update(defines)
+
+    def expand(self, name):
+        """Return the tokens of a macro, labeled by the macro name."""
+        ptoks = []
+        for lxm in self.defines[name]:
+            ptok = PToken(lxm)
+            ptok.kind = lexeme_kind(lxm)
+            ptoks.append(ptok)
+        ptoks[0].pp = name
+        return ptoks
+
+    def define(self, name, replacement=''):
+        """Define a preprocessor macro."""
+        # My berk scanner needs an endline
+        scanner = Scanner()
+        lexemes = scanner.parse((replacement or '') + '\n')
+
+        # NOTES:
+        # - We currently do not track whitespace created by macros.
+        # - This also strips the endline.
+        pp_lexemes = [lx for lx in lexemes if not lx.isspace()]
+
+        self.defines[name] = pp_lexemes
+
+    def condition(self, expr):
+        """Return the truth of an ``#if`` or ``#elif`` expression.
+
+        Invalid expressions are reported, and are false.
+        """
+        try:
+            return bool(condition.evaluate(expr, self.defines))
+        except (ValueError, ZeroDivisionError) as exc:
+            print('f90lex: invalid condition {}: {}'.format(expr, exc))
+            return False
+
     def preprocess(self, line):
         assert line[0] == '#'
         line = line[1:]
@@ -212,17 +567,7 @@ class Lexer(object):
         if directive == 'define':
             macro_name = words[1]
             replacement = words[2] if len(words) == 3 else ''
-
-            # My berk scanner needs an endline
-            scanner = Scanner()
-            lexemes = scanner.parse(replacement + '\n')
-
-            # NOTES:
-            # - We currently do not track whitespace created by macros.
-            # - This also strips the endline.
-            pp_lexemes = [lx for lx in lexemes if not lx.isspace()]
-
-            self.defines[macro_name] = pp_lexemes
+            self.define(macro_name, replacement)
 
         elif directive == 'undef':
             identifier = words[1]
@@ -234,11 +579,23 @@ class Lexer(object):
                 #       'defined.'.format(identifier))
                 pass
 
-        # Conditionals (stop_parsing not yet implemented (if ever))
+        # Conditionals
+        # NOTE: Directives within inactive branches are skipped by
+        #   skip_inactive(), except for the #elif, #else or #endif of the
+        #   current conditional.
 
-        # TODO (#if #elif)
-        #elif directive == 'if':
-        #    expr = line.strip().split(None, 1)[1]
+        elif directive.split('(', 1)[0] in ('if', 'elif'):
+            # Expressions do not require a whitespace delimiter
+            keyword = directive.split('(', 1)[0]
+            expr = line.strip()[len(keyword):].strip()
+
+            if keyword == 'if':
+                self.stop_parsing = not self.condition(expr)
+            elif not self.stop_parsing:
+                # The prior branch was active
+                self.stop_parsing = self.branch_taken = True
+            elif not self.branch_taken:
+                self.stop_parsing = not self.condition(expr)
 
         elif directive == 'ifdef':
             macro = line.split(None, 1)[1]
@@ -251,12 +608,16 @@ class Lexer(object):
                 self.stop_parsing = True
 
         elif directive == 'else':
-            self.stop_parsing = not self.stop_parsing
+            if not self.stop_parsing:
+                self.stop_parsing = self.branch_taken = True
+            elif not self.branch_taken:
+                self.stop_parsing = False
 
         elif directive == 'endif':
             self.stop_parsing = False
+            self.branch_taken = False
 
-        # Headers (this can't possibly be working...)
+        # Headers
 
         elif directive.startswith('include'):
             # This directive uniquely does not require a whitespace delimiter.
@@ -268,31 +629,13 @@ class Lexer(object):
             assert (words[1][0], words[1][-1]) in (('"', '"'), ('<', '>'))
             inc_fname = words[1][1:-1]
 
-            ## First check current directory
-            #curdir = os.path.dirname(self.path)
-            #test_fpath = os.path.join(curdir, inc_fname)
-
-            #inc_path = None
-            #if os.path.isfile(test_fpath):
-            #    inc_path = test_fpath
-            #elif self.project:
-            #    # Scan the project directories for the file
-            #    for idir in self.project.directories:
-            #        test_fpath = os.path.join(idir, inc_fname)
-            #        if os.path.isfile(test_fpath):
-            #            inc_path = test_fpath
-            ## else: do not bother looking
-
-            # XXX: Temporarily look in the current directory
-            inc_path = inc_fname if os.path.isfile(inc_fname) else None
+            # Quoted headers are also searched next to the source
+            source_dir = self.source_dir if words[1][0] == '"' else None
+            inc_path = include.find_include(inc_fname, source_dir,
+                                            self.include_paths)
 
             if inc_path:
-                with open(inc_path) as inc:
-                    lexer = Lexer(inc)
-                    lexer.defines = self.defines
-                    self.includes = []
-                    for stmt in lexer:
-                        self.includes.append(stmt)
+                self.includes.append(self.lex_include(inc_path))
             else:
                 print('f90lex: Include file {} not found; skipping.'
                       ''.format(inc_fname))
@@ -304,11 +647,86 @@ class Lexer(object):
                   ''.format(line).rstrip())
 
 
+# Kinds of liminal lexemes (along with ``;``), and of the liminals within a
+# statement
+liminal_kinds = frozenset((COMMENT, DIRECTIVE, WHITESPACE, ENDLINE))
+spacing_kinds = frozenset((COMMENT, WHITESPACE, ENDLINE))
+
+# Lexemes of a line which only contains liminals (as split by ``Scanner``)
+liminal_line = re.compile(r'([ \t]*)([!#][^\n]*)?(\n)').fullmatch
+
+# Runs of digits in a split token
+# NOTE: The number of digits in a run does not affect how a number is split,
+#   so the runs of a split number are compacted to a single digit.
+digit_runs = re.compile(r'[0-9]+').sub
+
+# Name of a preprocessor directive
+directive_name = re.compile(r'#\s*(\w*)')
+
+# Lines of a translated binary line, with their endlines
+split_lines = re.compile(r'[^\n]*\n|[^\n]+').findall
+
+
 def is_liminal(lexeme):
     return lexeme.isspace() or lexeme[0] in '!#' or lexeme == ';'
 
 
-def resplit_tokens(first, second):
+def is_name_part(lexeme):
+    """Return True if ``lexeme`` would continue a name."""
+    return lexeme.replace('_', 'a').isalnum()
+
+
+def join_split(values, texts, head, tail, kind, pos):
+    """Return a token which was split across lines."""
+    value = ''.join(values)
+    tok = Token(value)
+    tok.split = ''.join(texts)
+    tok.head = head
+    tok.tail = tail
+    tok.kind = kind if kind == STRING else lexeme_kind(value)
+    tok.pos = pos
+    return tok
+
+
+def lexeme_columns(lexemes):
+    """Return the column (from 1) of each lexeme of a line."""
+    return list(itertools.accumulate(
+        itertools.chain((1,), map(len, lexemes))
+    ))
+
+
+def is_binary(source):
+    """Return True if ``source`` is a binary stream."""
+    return isinstance(source, (io.RawIOBase, io.BufferedIOBase))
+
+
+def decode_lines(source):
+    """Generate the decoded lines of a binary source.
+
+    Endlines are translated as in text-mode files, so that ``\\r\\n`` and
+    ``\\r`` endlines are replaced by ``\\n``.
+    """
+    # NOTE: The UTF-8 decoder copies ASCII text without any translation
+    for line in source:
+        line = line.decode('utf-8', 'surrogateescape')
+        if '\r' in line:
+            for part in translate_endlines(line):
+                yield part
+        else:
+            yield line
+
+
+def translate_endlines(text):
+    """Return the lines of a text, with ``\r\n`` and ``\r`` as ``\n``."""
+    return split_lines(text.replace('\r\n', '\n').replace('\r', '\n'))
+
+
+def resplit_tokens(first, second, scanner=None):
+    """Return the lexemes of ``first`` and ``second`` when joined.
+
+    A reuseable ``scanner`` may be provided, but it must not be shared across
+    threads.
+    """
     # NOTE: Scanner needs an endline, and split strings expect line
     #   continuations in order to track the delimiter across multiple lines, so
     #   we append these when needed.
@@ -318,7 +736,9 @@ def resplit_tokens(first, second):
     else:
         lx_join = first + second + '\n'
 
-    scanner = Scanner()
+    if scanner is None:
+        scanner = Scanner()
+    scanner.prior_delim = None
     new_lx = scanner.parse(lx_join)
 
     # NOTE: Remove the redudant Scanner markup tokens
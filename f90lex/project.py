@@ -0,0 +1,71 @@
+"""Project-level f90lex functions.
+
+``lex_files`` lexes a collection of source files, distributing the files over
+a pool of worker processes.  Each file is returned as a compact
+``TokenStream``, which is cheap to transfer between processes.
+
+:copyright: Copyright 2021 Marshall Ward, see AUTHORS for details.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+from collections import OrderedDict
+import multiprocessing
+import os
+
+from f90lex.lexer import Lexer
+from f90lex.scanner import RegexScanner
+
+
+def lex_file(path, defines=None, scanner=RegexScanner, cache=None,
+             include_paths=None):
+    """Lex a single source file into a ``TokenStream``.
+
+    If a ``TokenCache`` is provided, then unchanged files are read from the
+    cache.
+    """
+    if cache is not None:
+        return cache.lex(path, defines=defines, scanner=scanner,
+                         include_paths=include_paths)
+
+    with open(path, 'rb') as src:
+        lexer = Lexer(src, scanner=scanner, defines=defines,
+                      include_paths=include_paths)
+        return lexer.stream()
+
+
+def lex_files(paths, jobs=None, defines=None, scanner=RegexScanner,
+              cache=None, include_paths=None):
+    """Lex a collection of source files in parallel.
+
+    Files are distributed over ``jobs`` worker processes (by default, one per
+    CPU), and each worker starts from the same initial ``defines``.  The
+    result is an ordered mapping of each path to its ``TokenStream``.  An
+    optional ``TokenCache`` is shared by all workers.
+
+    Headers are searched in ``include_paths``, and each worker keeps its own
+    cache of lexed headers.
+    """
+    paths = list(paths)
+    tasks = [(path, defines, scanner, cache, include_paths) for path in paths]
+    return OrderedDict(zip(paths, map_tasks(lex_task, tasks, jobs)))
+
+
+def lex_task(task):
+    return lex_file(*task)
+
+
+def map_tasks(func, tasks, jobs=None):
+    """Apply ``func`` to each task over a pool of ``jobs`` processes."""
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(tasks)))
+
+    if jobs == 1:
+        return [func(task) for task in tasks]
+
+    chunksize = max(1, len(tasks) // (4 * jobs))
+    pool = multiprocessing.Pool(jobs)
+    try:
+        return pool.map(func, tasks, chunksize)
+    finally:
+        pool.close()
+        pool.join()
@@ -10,10 +10,28 @@ used in the future.
 ``Scanner`` is a slightly updated version of the scanner which appeared in the
 ``flint`` project (and is probably going to be ported back over anyway...).
 
+``RegexScanner`` is an alternative engine which produces the same lexemes, but
+matches each one with a single compiled pattern rather than stepping through
+the line one character at a time.
+
+Each call to ``parse`` also sets ``kinds``, a list of the kind of each lexeme
+(``NAME``, ``INTEGER``, ``REAL``, ``STRING``, ``OPERATOR``, ``DOT_OPERATOR``,
+``COMMENT``, ``DIRECTIVE``, ``WHITESPACE``, ``CONTINUATION`` or ``ENDLINE``).
+Kinds are small integers, so that they can be cheaply compared and stored.
+
 :copyright: Copyright 2021 Marshall Ward, see AUTHORS for details.
 :license: Apache License, Version 2.0, see LICENSE for details.
 """
 import itertools
+from operator import itemgetter
+import re
+
+# Lexeme kinds
+(NAME, INTEGER, REAL, STRING, OPERATOR, DOT_OPERATOR, COMMENT, DIRECTIVE,
+ WHITESPACE, CONTINUATION, ENDLINE) = range(11)
+
+kind_names = ('name', 'integer', 'real', 'string', 'operator', 'dot-operator',
+              'comment', 'directive', 'whitespace', 'continuation', 'endline')
 
 
 class Scanner(object):
@@ -32,9 +50,13 @@ class Scanner(object):
 
         self.prior_delim = None
 
+        # Kinds of the most recently parsed lexemes
+        self.kinds = []
+
     def parse(self, line, macros={}):
         """Tokenize a line of Fortran source."""
         tokens = []
+        kinds = []
 
         self.idx = -1   # Bogus value to ensure idx = 0 after first iteration
         self.characters = iter(line)
@@ -46,23 +68,29 @@ class Scanner(object):
         while self.char != '\n':
             word = ''
             if self.char in ' \t':
+                kind = WHITESPACE
                 while self.char in ' \t':
                     word += self.char
                     self.update_chars()
             #elif self.char in '"\'' or self.prior_delim
             #                            and self.char not in '&!'):
             elif self.char in '"\'' or (self.prior_delim and not lc):
+                kind = STRING
                 word = self.parse_string()
                 if self.prior_delim:
                     lc = True
 
             elif self.char.isalpha() or self.char == '_':
+                kind = NAME
                 word = self.parse_name(line)
 
             elif self.char.isdigit():
                 word = self.parse_numeric()
+                kind = numeric_kind(word)
 
             elif self.char in ('!', '#'):
+                kind = COMMENT if self.char == '!' else DIRECTIVE
+
                 # Abort the iteration and build the comment token
                 word = line[self.idx:-1]
                 self.char = '\n'
@@ -70,9 +98,11 @@ class Scanner(object):
             elif self.char == '.':
                 self.update_chars()
                 if self.char.isdigit():
+                    kind = REAL
                     frac = self.parse_numeric()
                     word = '.' + frac
                 else:
+                    kind = DOT_OPERATOR
                     word = '.'
                     while self.char.isalpha():
                         word += self.char
@@ -84,7 +114,10 @@ class Scanner(object):
             elif self.char in Scanner.punctuation:
                 # Turn off leading line continuation
                 if self.char == '&':
+                    kind = CONTINUATION
                     lc = False
+                else:
+                    kind = OPERATOR
 
                 word = self.char
                 self.update_chars()
@@ -98,6 +131,7 @@ class Scanner(object):
                 if self.prior_char + self.char in self.pairs:
                     word = self.prior_char + self.char
                     tokens.append(word)
+                    kinds.append(OPERATOR)
                     self.update_chars()
                     continue
 
@@ -112,10 +146,13 @@ class Scanner(object):
                 word = macros[word]
 
             tokens.append(word)
+            kinds.append(kind)
 
         # Append the final endline
         tokens.append(self.char)
+        kinds.append(ENDLINE)
 
+        self.kinds = kinds
         return tokens
 
     def parse_name(self, line):
@@ -222,3 +259,272 @@ class Scanner(object):
     def update_chars(self):
         self.prior_char, self.char = self.char, next(self.characters)
         self.idx += 1
+
+
+def numeric_kind(word):
+    """Return the kind of a numeric literal."""
+    # Reals contain a decimal point or exponent before any kind parameter
+    return INTEGER if word.split('_', 1)[0].isdigit() else REAL
+
+
+# Kinds of lexemes by their first character
+first_kinds = dict.fromkeys(Scanner.punctuation, OPERATOR)
+first_kinds.update(dict.fromkeys('abcdefghijklmnopqrstuvwxyz'
+                                 'ABCDEFGHIJKLMNOPQRSTUVWXYZ_', NAME))
+first_kinds.update(dict.fromkeys('0123456789', INTEGER))
+first_kinds.update(dict.fromkeys(' \t', WHITESPACE))
+first_kinds.update({'\'': STRING, '"': STRING, '!': COMMENT, '#': DIRECTIVE,
+                    '.': DOT_OPERATOR, '&': CONTINUATION, '\n': ENDLINE})
+
+
+# Kind of a lexeme of the ``RegexScanner.lexemes`` split, by its real group
+# (``''`` for reals, ``None`` otherwise)
+real_marks = {'': REAL}
+
+
+def lexeme_kind(lexeme):
+    """Return the kind of a lexeme, from its text.
+
+    The lexeme must be complete; the continued part of a split string does
+    not start with a delimiter.
+    """
+    first = lexeme[0]
+    kind = first_kinds.get(first)
+    if kind is None:
+        if first.isalpha():
+            kind = NAME
+        elif first.isdigit():
+            kind = INTEGER
+        else:
+            kind = OPERATOR
+
+    if kind == INTEGER:
+        kind = numeric_kind(lexeme)
+    elif kind == DOT_OPERATOR and lexeme[1:2].isdigit():
+        kind = REAL
+
+    return kind
+
+
+def string_body(delim):
+    """Return a pattern for an opening delimiter and its string contents."""
+    return r'{0}(?:[^{0}&\n]|{0}{0}|&(?![ \t]*\n))*'.format(delim)
+
+
+class RegexScanner(Scanner):
+    """A Scanner which matches each lexeme with a compiled pattern.
+
+    The lexemes (and the split string state in ``prior_delim``) are identical
+    to ``Scanner.parse``.  Most lines are split by a single ``split`` of the
+    master pattern.  Lines with split strings are matched one lexeme at a time,
+    and any line which the patterns do not describe (e.g. non-ASCII names,
+    missing endlines, or unterminated strings) is handed to the character
+    scanner, so that its errors are also reproduced.  Lexeme kinds are taken
+    from the rule which matched each lexeme.
+    """
+
+    # Numeric literals, and reals with a decimal point or exponent
+    kind_param = r'(?:_(?:[A-Za-z][A-Za-z0-9_]*|[A-Za-z0-9]*))?'
+    exponent = r'[eEdD][+-]?[0-9]*'
+    real = (r'(?:[0-9]+(?:\.[0-9]*(?:' + exponent + ')?|' + exponent + ')'
+            r'|\.[0-9]+(?:\.[0-9]*)?(?:' + exponent + ')?)' + kind_param)
+
+    rules = [
+        ('space', r'[ \t]+'),
+        ('string', r'[\'"]'),
+        ('name', r'[A-Za-z_][A-Za-z0-9_]*'),
+        ('real', real),
+        ('integer', r'[0-9]+' + kind_param),
+        ('comment', r'!.*'),
+        ('directive', r'#.*'),
+        ('dot', r'\.[A-Za-z]*\.?'),
+        ('pair', '|'.join(re.escape(p) for p in Scanner.pairs)),
+        ('continuation', '&'),
+        ('punct', '[' + re.escape(Scanner.punctuation) + ']'),
+    ]
+
+    # Lexeme kind of each rule
+    rule_kinds = {
+        'space': WHITESPACE, 'string': STRING, 'name': NAME, 'real': REAL,
+        'integer': INTEGER, 'comment': COMMENT, 'directive': DIRECTIVE,
+        'dot': DOT_OPERATOR, 'pair': OPERATOR, 'continuation': CONTINUATION,
+        'punct': OPERATOR,
+    }
+
+    # Single lexeme, tagged by rule name
+    lexeme = re.compile('|'.join('(?P<{}>{})'.format(*r) for r in rules))
+
+    # Any lexeme of a line without split strings
+    line_rules = ([r for r in rules if r[0] != 'string']
+                  + [('string', string_body(delim) + delim)
+                     for delim in '\'"'])
+
+    # The lexemes of a line are split out as a group, followed by an empty
+    # group which is only matched by reals.  The kind of any other lexeme
+    # follows from its first character.
+    lexemes = re.compile('({})'.format('|'.join(
+        rule + '()' if name == 'real' else rule for name, rule in line_rules
+    )))
+
+    # The same pattern without groups, for byte buffers
+    blexemes = re.compile(
+        '|'.join(rule for name, rule in line_rules).encode('ascii')
+    )
+
+    # String contents, terminated by either the closing delimiter or a
+    # trailing `&`.  A missing closing delimiter marks a split string.
+    strings = {
+        delim: re.compile(string_body(delim)[1:]
+                          + r'(?:({0})|(?=&[ \t]*\n))'.format(delim))
+        for delim in '\'"'
+    }
+
+    def parse(self, line, macros={}):
+        """Tokenize a line of Fortran source."""
+        # Macro substitution and irregular lines use the character scanner
+        end = len(line) - 1
+        if macros or end < 0 or line.find('\n') != end:
+            return super(RegexScanner, self).parse(line, macros)
+
+        # Most lines are fully described by the master pattern
+        if not self.prior_delim:
+            parts = self.lexemes.split(line)
+            tokens = parts[1::3]
+            if sum(map(len, tokens)) == end:
+                kinds = list(map(real_marks.get, parts[2::3],
+                                 map(first_kinds.__getitem__,
+                                     map(itemgetter(0), tokens))))
+                tokens.append('\n')
+                kinds.append(ENDLINE)
+                self.kinds = kinds
+                return tokens
+
+        prior_delim = self.prior_delim
+        tokens = self.match_lexemes(line)
+
+        if tokens is None:
+            self.prior_delim = prior_delim
+            return super(RegexScanner, self).parse(line, macros)
+
+        return tokens
+
+    def scan(self, buf, pos=0, endpos=None, encoding='utf-8'):
+        """Generate the lexeme offsets of each line in a buffer.
+
+        ``buf`` is either a string or a bytes-like object (such as an
+        ``mmap``) which is scanned in place.  Each iteration returns a list of
+        ``(start, end)`` offsets, one per lexeme as produced by ``parse``, with
+        the final endline (``\\n`` or ``\\r\\n``) as the last lexeme.  A
+        final line without an endline is scanned as if it had one.
+        """
+        if endpos is None:
+            endpos = len(buf)
+
+        binary = not isinstance(buf, str)
+        if binary:
+            newline, cr = b'\n', b'\r'
+            finditer = self.blexemes.finditer
+        else:
+            newline, cr = '\n', '\r'
+            finditer = self.lexemes.finditer
+
+        while pos < endpos:
+            eol = buf.find(newline, pos, endpos)
+            if eol < 0:
+                eol = endpos
+                next_pos = endpos
+            else:
+                next_pos = eol + 1
+
+            end = eol - 1 if eol > pos and buf[eol - 1:eol] == cr else eol
+
+            spans = None
+            if not self.prior_delim:
+                spans = []
+                idx = pos
+                for m in finditer(buf, pos, end):
+                    if m.start() != idx:
+                        break
+                    idx = m.end()
+                    spans.append((m.start(), idx))
+                if idx != end:
+                    spans = None
+
+            # Split strings and irregular lines are scanned as text
+            if spans is None:
+                line = buf[pos:end]
+                if binary:
+                    line = line.decode(encoding, 'surrogateescape')
+                spans = []
+                idx = pos
+                for lx in self.parse(line + '\n')[:-1]:
+                    size = (len(lx.encode(encoding, 'surrogateescape'))
+                            if binary else len(lx))
+                    spans.append((idx, idx + size))
+                    idx += size
+
+            spans.append((end, next_pos))
+            yield spans
+
+            pos = next_pos
+
+    def match_lexemes(self, line):
+        """Return the lexemes of ``line``, or ``None`` if a match fails."""
+        tokens = []
+        kinds = []
+        match = self.lexeme.match
+        strings = self.strings
+
+        # String line continuation?
+        lc = True if self.prior_delim else False
+
+        pos = 0
+        end = len(line) - 1
+        while pos < end:
+            if self.prior_delim and not lc and line[pos] not in ' \t':
+                m = strings[self.prior_delim].match(line, pos)
+                if not m:
+                    return None
+                if m.group(1):
+                    self.prior_delim = None
+                else:
+                    lc = True
+                tokens.append(line[pos:m.end()])
+                kinds.append(STRING)
+                pos = m.end()
+                continue
+
+            m = match(line, pos)
+            if not m:
+                return None
+
+            group = m.lastgroup
+            kind = self.rule_kinds[group]
+            if group == 'string':
+                # Quotes inside of an unresolved split string are read by
+                # Scanner as a continuation of that string.
+                if self.prior_delim:
+                    return None
+
+                delim = line[pos]
+                m = strings[delim].match(line, pos + 1)
+                if not m:
+                    return None
+                if m.group(1) is None:
+                    self.prior_delim = delim
+                    lc = True
+
+            elif group == 'continuation':
+                # Turn off leading line continuation
+                lc = False
+
+            tokens.append(line[pos:m.end()])
+            kinds.append(kind)
+            pos = m.end()
+
+        # Append the final endline
+        tokens.append('\n')
+        kinds.append(ENDLINE)
+
+        self.kinds = kinds
+        return tokens
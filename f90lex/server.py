@@ -0,0 +1,250 @@
+"""Local f90lex lexing server.
+
+``LexServer`` holds the lexed token streams of a source tree in memory, and
+serves them to local clients over a Unix domain socket.  This allows several
+tools to share the lexing of the same files, rather than each tool lexing the
+files from the start.
+
+A file is only lexed again if its size or modification time has changed, and
+its contents differ from the stored result.  Unlike ``TokenCache``, the
+contents of ``#include`` headers are not tracked.  At most ``max_entries``
+results are stored, and the least recently used result is removed when the
+store is full.  The results of a removed file are dropped when it is next
+requested.
+
+Each request is a line of JSON with the ``path`` of a file in the tree and an
+optional ``defines`` mapping.  The response is a line of JSON with the
+``size`` of the result (or an ``error``), followed by the ``TokenStream`` of
+the file in the binary form of ``TokenStream.tobytes``.  ``LexClient`` sends
+these requests, and restores the token streams.
+
+The server can be run as::
+
+   python -m f90lex.server SOCKET [ROOT]
+
+:copyright: Copyright 2021 Marshall Ward, see AUTHORS for details.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+import argparse
+from collections import OrderedDict
+import hashlib
+import io
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+
+from f90lex.index import file_stamp
+from f90lex.lexer import Lexer
+from f90lex.scanner import RegexScanner
+from f90lex.stream import TokenStream
+
+# Extensions of the Fortran sources of a tree
+source_extensions = ('.f90', '.F90', '.f95', '.F95', '.f03', '.F03', '.f08',
+                     '.F08')
+
+
+class StreamStore(object):
+    """Token streams of source files, which are lexed again when changed."""
+    def __init__(self, scanner=RegexScanner, include_paths=None,
+                 max_entries=4096):
+        self.scanner = scanner
+        self.include_paths = list(include_paths or [])
+        self.max_entries = max_entries
+
+        # Stamp, content digest, and stream data of each path and defines, in
+        # order of use
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        # Number of files which were lexed
+        self.lex_count = 0
+
+    def get(self, path, defines=None):
+        """Return the token stream data of a file, lexing it if changed."""
+        key = (path, tuple(sorted((defines or {}).items())))
+        try:
+            stamp = file_stamp(path)
+        except OSError:
+            with self.lock:
+                self.entries.pop(key, None)
+            raise
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == stamp:
+                self.entries.move_to_end(key)
+                return entry[2]
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).digest()
+
+        if entry and entry[1] == digest:
+            result = entry[2]
+        else:
+            src = io.BytesIO(data)
+            src.name = path
+            lexer = Lexer(src, scanner=self.scanner, defines=defines,
+                          include_paths=self.include_paths)
+            result = lexer.stream().tobytes()
+            with self.lock:
+                self.lex_count += 1
+
+        with self.lock:
+            self.entries[key] = (stamp, digest, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return result
+
+
+class LexHandler(socketserver.StreamRequestHandler):
+    """Server requests of a client connection."""
+    def handle(self):
+        for line in self.rfile:
+            # NOTE: Any error of a request should not close the connection
+            try:
+                request = json.loads(line.decode('utf-8'))
+                data = self.server.stream_data(request['path'],
+                                               request.get('defines'))
+            except Exception as exc:
+                header = {'error': '{}: {}'.format(type(exc).__name__, exc)}
+                data = b''
+            else:
+                header = {'size': len(data)}
+
+            self.wfile.write(json.dumps(header).encode('utf-8') + b'\n')
+            self.wfile.write(data)
+            self.wfile.flush()
+
+
+class LexServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """A Unix socket server of the token streams of a source tree.
+
+    Only files within ``root`` are served.  The socket is only accessible to
+    the current user.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, root=os.curdir, scanner=RegexScanner,
+                 include_paths=None):
+        self.root = os.path.realpath(root)
+        self.store = StreamStore(scanner, include_paths)
+
+        # Replace a stale socket, but no other file
+        if os.path.exists(socket_path):
+            if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+                raise FileExistsError('f90lex: server: {} is not a socket'
+                                      ''.format(socket_path))
+            os.remove(socket_path)
+        socketserver.UnixStreamServer.__init__(self, socket_path, LexHandler)
+        os.chmod(socket_path, 0o600)
+
+    def stream_data(self, path, defines=None):
+        """Return the token stream data of a file in the tree."""
+        path = os.path.realpath(os.path.join(self.root, path))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ValueError('{} is outside of {}'.format(path, self.root))
+        return self.store.get(path, defines)
+
+    def warm(self, defines=None):
+        """Lex the sources of the tree, and return the number of files.
+
+        Files which cannot be lexed are reported and skipped, and are not
+        counted.
+        """
+        nfiles = 0
+        for path in tree_sources(self.root):
+            # NOTE: Any error of a single file should not prevent startup
+            try:
+                self.store.get(path, defines)
+            except Exception as exc:
+                print('f90lex: server: skipping {}: {}: {}'
+                      ''.format(path, type(exc).__name__, exc))
+            else:
+                nfiles += 1
+        return nfiles
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        try:
+            os.remove(self.server_address)
+        except OSError:
+            pass
+
+
+class LexClient(object):
+    """A client of a ``LexServer``."""
+    def __init__(self, socket_path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self.rfile = self.sock.makefile('rb')
+
+    def stream(self, path, defines=None):
+        """Return the ``TokenStream`` of a file.
+
+        An ``OSError`` is raised if the server cannot lex the file.
+        """
+        request = {'path': os.path.abspath(path), 'defines': defines}
+        self.sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+
+        header = json.loads(self.rfile.readline().decode('utf-8'))
+        if 'error' in header:
+            raise OSError('f90lex: server: {}'.format(header['error']))
+        data = self.rfile.read(header['size'])
+        return TokenStream.frombytes(data)
+
+    def lex(self, path, defines=None):
+        """Return an iterator over the statements of a file, as ``Lexer``."""
+        return iter(self.stream(path, defines))
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def tree_sources(root):
+    """Generate the paths of the Fortran sources within a directory."""
+    for dirpath, dirnames, fnames in os.walk(root):
+        dirnames.sort()
+        for fname in sorted(fnames):
+            if fname.endswith(source_extensions):
+                yield os.path.join(dirpath, fname)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('socket', help='Path of the Unix socket')
+    parser.add_argument('root', nargs='?', default=os.curdir,
+                        help='Root directory of the source tree')
+    parser.add_argument('-I', dest='include_paths', action='append',
+                        default=[], help='Header search path')
+    parser.add_argument('--no-warm', action='store_true',
+                        help='Do not lex the tree on startup')
+    args = parser.parse_args()
+
+    server = LexServer(args.socket, args.root,
+                       include_paths=args.include_paths)
+    if not args.no_warm:
+        nfiles = server.warm()
+        print('f90lex: server: lexed {} files'.format(nfiles))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""f90lex lexer statistics.
+
+``LexerStats`` records the time spent in each phase of a ``Lexer``, along with
+counts of the tokens and liminals of its statements.  Phases are timed by
+replacing the methods of a lexer (and its scanner) with timed wrappers, so
+that a lexer without statistics is unchanged.
+
+The phases are:
+
+``parse``
+   Lexeme scanning of each line (``Scanner.parse``).  Blank, comment and
+   directive lines between statements are not scanned.
+``liminals``
+   Gathering of liminals between statements (``get_liminals``)
+``resplit``
+   Reconstruction of tokens split by a line continuation
+``macros``
+   Macro substitution of tokens
+``preprocess``
+   Preprocessor directives (``preprocess``)
+``include``
+   Lexing of ``#include`` headers, or retrieval from the include cache.
+   Headers are read as their statements are returned, and are timed over
+   every statement.
+
+Phase times are inclusive, so that e.g. ``liminals`` includes the time spent
+in ``parse`` for those lines.
+
+:copyright: Copyright 2021 Marshall Ward, see AUTHORS for details.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+from collections import OrderedDict
+import sys
+import time
+
+
+class LexerStats(object):
+    """Phase timers and token counters of a lexer."""
+
+    phases = ('parse', 'liminals', 'resplit', 'macros', 'preprocess',
+              'include')
+    counters = ('statements', 'tokens', 'liminals', 'continuations',
+                'macros', 'max_statement')
+
+    def __init__(self, name=None):
+        # Source name, for reports
+        self.name = name
+
+        self.times = OrderedDict((phase, 0.) for phase in self.phases)
+        self.calls = OrderedDict((phase, 0) for phase in self.phases)
+        self.counts = OrderedDict((name, 0) for name in self.counters)
+
+    def timer(self, phase, func):
+        """Return a version of ``func`` which is timed as ``phase``."""
+        times, calls = self.times, self.calls
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                times[phase] += clock() - start
+                calls[phase] += 1
+
+        return timed
+
+    def iter_timer(self, phase, func):
+        """Return a version of ``func`` whose returned iterator is timed."""
+        times, calls = self.times, self.calls
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            calls[phase] += 1
+            start = clock()
+            try:
+                it = iter(func(*args, **kwargs))
+            finally:
+                times[phase] += clock() - start
+
+            while True:
+                start = clock()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+                finally:
+                    times[phase] += clock() - start
+                yield item
+
+        return timed
+
+    def instrument(self, lexer):
+        """Replace the phase methods of a lexer with timed methods."""
+        if self.name is None:
+            self.name = lexer.name
+
+        lexer.scanner.parse = self.timer('parse', lexer.scanner.parse)
+        lexer.get_liminals = self.timer('liminals', lexer.get_liminals)
+        lexer.resplit = self.timer('resplit', lexer.resplit)
+        lexer.expand = self.timer('macros', lexer.expand)
+        lexer.preprocess = self.timer('preprocess', lexer.preprocess)
+        lexer.lex_include = self.iter_timer('include', lexer.lex_include)
+
+    def statement(self, statement, span):
+        """Count the tokens, liminals and lines of a statement.
+
+        Continuations are the lines following the first line of the
+        statement, as given by its ``span``.
+        """
+        counts = self.counts
+        counts['statements'] += 1
+        counts['tokens'] += len(statement)
+        counts['max_statement'] = max(counts['max_statement'], len(statement))
+        counts['continuations'] += span[1] - span[0]
+
+        for tok in statement:
+            counts['liminals'] += len(tok.tail)
+            if getattr(tok, 'pp', None):
+                counts['macros'] += 1
+
+    def as_dict(self):
+        return OrderedDict([
+            ('name', self.name),
+            ('times', OrderedDict(self.times)),
+            ('calls', OrderedDict(self.calls)),
+            ('counts', OrderedDict(self.counts)),
+        ])
+
+    def dump(self, out=None):
+        """Write a summary of the statistics to ``out`` (default stdout)."""
+        if out is None:
+            out = sys.stdout
+
+        out.write('f90lex: stats: {}\n'.format(self.name or '<source>'))
+        for phase in self.phases:
+            out.write('  {:12s} {:10.6f}s {:8d} calls\n'.format(
+                phase, self.times[phase], self.calls[phase]))
+        for name in self.counters:
+            out.write('  {:14s} {:8d}\n'.format(name, self.counts[name]))
@@ -0,0 +1,363 @@
+"""Compact f90lex token streams.
+
+``TokenStream`` stores the statements of a ``Lexer`` as a set of flat arrays,
+rather than a graph of ``Token`` objects and liminal lists.  All of the text is
+held in a single string (the roundtrip rendering of the source), and tokens and
+liminals are described by their offsets into this string.
+
+Iterating over a ``TokenStream`` returns the same statements as the original
+``Lexer``, with ``Token`` and ``PToken`` objects created one statement at a
+time.  The ``head`` and ``tail`` liminal lists of adjacent tokens are shared,
+as in the ``Lexer`` output.
+
+A stream can be saved to a compact binary form with ``tobytes``, and restored
+with ``frombytes``.
+
+:copyright: Copyright 2021 Marshall Ward, see AUTHORS for details.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+from array import array
+import struct
+import sys
+
+from f90lex.ftoken import Token, PToken
+
+
+class TokenStream(object):
+    """A compact, array-based representation of lexed statements."""
+
+    # Token flags
+    SPLIT = 1       # Token was split across lines, rendered as ``split``
+    PREPROC = 2     # Preprocessed ``PToken``, rendered as ``pp``
+    HEAD_FREE = 4   # Head is not the tail of a prior token
+    TAIL_FREE = 8   # Tail is not the head of a later token
+
+    # Binary format: magic, version, byte order, and column type codes
+    magic = b'F90LEXTS'
+    version = 3
+    columns = ('tok_start', 'tok_end', 'tok_flags', 'tok_kind', 'tok_line',
+               'tok_col', 'tok_value', 'tok_lims', 'lim_end', 'stmt_start')
+
+    def __init__(self):
+        # Rendered source text
+        self.text = ''
+
+        # Token columns
+        self.tok_start = array('I')     # Start of rendered token text
+        self.tok_end = array('I')       # End of rendered token text
+        self.tok_flags = array('B')
+        self.tok_kind = array('b')      # Lexeme kind, or -1 if unknown
+        self.tok_line = array('I')      # Source line, or 0 if unknown
+        self.tok_col = array('I')       # Source column
+        self.tok_value = array('i')     # Index of value in ``values``, or -1
+        self.tok_lims = array('I')      # Index of first tail liminal
+
+        # Liminal end offsets; each liminal starts at the end of the prior
+        # liminal, or at the end of its token.
+        self.lim_end = array('I')
+
+        # Index of the first token of each statement
+        self.stmt_start = array('I')
+
+        # Token values which differ from their rendered text
+        self.values = []
+
+        # Number of liminals preceding the first token
+        self.head_size = 0
+
+    @classmethod
+    def from_lexer(cls, lexer):
+        """Create a token stream from the remaining statements of a lexer."""
+        return cls.from_statements(lexer, lexer.prior_tail)
+
+    @classmethod
+    def from_statements(cls, statements, head=None):
+        """Create a token stream from statements and their leading liminals.
+
+        A token and its tail are only stored once a later token has linked to
+        the tail, since a lexer may extend a tail after returning its
+        statement.
+        """
+        stream = cls()
+        if head is None:
+            head = []
+
+        chunks = []
+        size = 0
+        pending = []
+        flags = []
+
+        for stmt in statements:
+            stream.stmt_start.append(len(stream.tok_flags) + len(pending))
+            for tok in stmt:
+                # Search for the owner of the token's head
+                if tok.head is head:
+                    owner = -1
+                else:
+                    owner = len(pending) - 1
+                    while owner >= 0 and pending[owner].tail is not tok.head:
+                        owner -= 1
+
+                if tok.head is head or owner >= 0:
+                    size = stream._flush(pending, flags, owner, head,
+                                         chunks, size)
+                    head = None
+                    pending, flags = [], []
+                    flags.append(0)
+                else:
+                    flags.append(TokenStream.HEAD_FREE)
+
+                pending.append(tok)
+
+        # The final tail is assumed to belong to the last token with liminals
+        owner = len(pending) - 1
+        while owner > 0 and not pending[owner].tail:
+            owner -= 1
+        stream._flush(pending, flags, owner, head, chunks, size)
+
+        stream.text = ''.join(chunks)
+        return stream
+
+    @classmethod
+    def join(cls, streams):
+        """Join the streams of consecutive parts of a source.
+
+        Each part must start on a new line after a complete statement.  The
+        leading liminals of each part then continue the final tail of the
+        prior part, which immediately precedes them in the joined arrays.
+        """
+        stream = cls()
+        texts = []
+        size = 0
+        head = True
+
+        for part in streams:
+            n_lims = len(stream.lim_end)
+            n_values = len(stream.values)
+
+            # Liminals preceding the first token of the joined stream
+            if head:
+                if part.tok_flags:
+                    stream.head_size += part.head_size
+                    head = False
+                else:
+                    stream.head_size += len(part.lim_end)
+
+            # Shift the offsets and indices of the part
+            shift = size.__add__
+            stream.stmt_start.extend(map(len(stream.tok_flags).__add__,
+                                         part.stmt_start))
+            stream.tok_start.extend(map(shift, part.tok_start))
+            stream.tok_end.extend(map(shift, part.tok_end))
+            stream.tok_flags.extend(part.tok_flags)
+            stream.tok_kind.extend(part.tok_kind)
+            stream.tok_line.extend(part.tok_line)
+            stream.tok_col.extend(part.tok_col)
+            stream.tok_value.extend(idx + n_values if idx >= 0 else idx
+                                    for idx in part.tok_value)
+            stream.tok_lims.extend(map(n_lims.__add__, part.tok_lims))
+            stream.lim_end.extend(map(shift, part.lim_end))
+            stream.values.extend(part.values)
+
+            texts.append(part.text)
+            size += len(part.text)
+
+        stream.text = ''.join(texts)
+        return stream
+
+    def _flush(self, tokens, flags, owner, head, chunks, size):
+        # Store the pending tokens (and the file head, if not yet stored)
+        if head is not None:
+            for lim in head:
+                chunks.append(lim)
+                size += len(lim)
+                self.lim_end.append(size)
+            self.head_size = len(head)
+
+        for idx, tok in enumerate(tokens):
+            flag = flags[idx]
+            if idx != owner:
+                flag |= TokenStream.TAIL_FREE
+
+            if tok.split:
+                flag |= TokenStream.SPLIT
+                text = tok.split
+            elif isinstance(tok, PToken):
+                flag |= TokenStream.PREPROC
+                text = tok.pp
+            else:
+                text = str(tok)
+
+            self.tok_start.append(size)
+            chunks.append(text)
+            size += len(text)
+            self.tok_end.append(size)
+            self.tok_flags.append(flag)
+            self.tok_kind.append(-1 if tok.kind is None else tok.kind)
+            line, col = tok.pos or (0, 0)
+            self.tok_line.append(line)
+            self.tok_col.append(col)
+
+            if flag & (TokenStream.SPLIT | TokenStream.PREPROC):
+                self.tok_value.append(len(self.values))
+                self.values.append(str.__str__(tok))
+            else:
+                self.tok_value.append(-1)
+
+            self.tok_lims.append(len(self.lim_end))
+            for lim in tok.tail:
+                chunks.append(lim)
+                size += len(lim)
+                self.lim_end.append(size)
+
+        return size
+
+    def tobytes(self):
+        """Return the stream in a compact binary form.
+
+        Text is encoded as UTF-8 with surrogate escapes, so that any
+        undecoded bytes of a binary source are preserved.
+        """
+        values = [v.encode('utf-8', 'surrogateescape') for v in self.values]
+        value_sizes = array('I', [len(v) for v in values])
+        text = self.text.encode('utf-8', 'surrogateescape')
+
+        arrays = [getattr(self, name) for name in TokenStream.columns]
+        arrays.append(value_sizes)
+        sizes = [self.head_size, len(text)] + [len(a) for a in arrays]
+
+        return b''.join(
+            [self._header(), struct.pack('<%dQ' % len(sizes), *sizes)]
+            + [a.tobytes() for a in arrays] + values + [text]
+        )
+
+    @classmethod
+    def frombytes(cls, data):
+        """Create a stream from the output of ``tobytes``.
+
+        A ``ValueError`` is raised if the data was not produced by a
+        compatible stream (e.g. from another f90lex version or platform).
+        """
+        stream = cls()
+
+        header = stream._header()
+        if data[:len(header)] != header:
+            raise ValueError('f90lex: incompatible token stream data.')
+        pos = len(header)
+
+        value_sizes = array('I')
+        arrays = [getattr(stream, name) for name in TokenStream.columns]
+        arrays.append(value_sizes)
+
+        fmt = '<%dQ' % (len(arrays) + 2)
+        sizes = struct.unpack_from(fmt, data, pos)
+        pos += struct.calcsize(fmt)
+
+        stream.head_size, text_size = sizes[:2]
+        for a, size in zip(arrays, sizes[2:]):
+            nbytes = size * a.itemsize
+            a.frombytes(data[pos:pos + nbytes])
+            pos += nbytes
+
+        for size in value_sizes:
+            stream.values.append(
+                data[pos:pos + size].decode('utf-8', 'surrogateescape')
+            )
+            pos += size
+
+        stream.text = data[pos:pos + text_size].decode('utf-8',
+                                                       'surrogateescape')
+
+        return stream
+
+    def _header(self):
+        # Binary format identifier
+        layout = ''.join(getattr(self, name).typecode
+                         for name in TokenStream.columns)
+        return b''.join([
+            TokenStream.magic,
+            struct.pack('<BB', TokenStream.version, array('I').itemsize),
+            sys.byteorder[0].encode('ascii'),
+            layout.encode('ascii'),
+        ])
+
+    def __len__(self):
+        return len(self.stmt_start)
+
+    def __iter__(self):
+        tail = self.head
+        for idx in range(len(self)):
+            stmt, tail = self._statement(idx, tail)
+            yield stmt
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('statement index out of range')
+
+        # Reconstruct the tail of the prior linked token
+        tok = self.stmt_start[idx] - 1
+        while tok >= 0 and self.tok_flags[tok] & TokenStream.TAIL_FREE:
+            tok -= 1
+
+        return self._statement(idx, self.liminals(tok))[0]
+
+    @property
+    def head(self):
+        """The liminals preceding the first token."""
+        return self.liminals(-1)
+
+    def liminals(self, tok):
+        """Return the tail liminals of a token, or the head if ``tok < 0``."""
+        if tok < 0:
+            first, last = 0, self.head_size
+            start = 0
+        else:
+            first = self.tok_lims[tok]
+            last = (self.tok_lims[tok + 1] if tok + 1 < len(self.tok_lims)
+                    else len(self.lim_end))
+            start = self.tok_end[tok]
+
+        lims = []
+        for end in self.lim_end[first:last]:
+            lims.append(self.text[start:end])
+            start = end
+        return lims
+
+    def token(self, idx):
+        """Return the token at index ``idx``, without any liminals."""
+        text = self.text[self.tok_start[idx]:self.tok_end[idx]]
+        flags = self.tok_flags[idx]
+        if flags & TokenStream.PREPROC:
+            tok = PToken(self.values[self.tok_value[idx]], pp=text)
+        elif flags & TokenStream.SPLIT:
+            tok = Token(self.values[self.tok_value[idx]])
+            tok.split = text
+        else:
+            tok = Token(text)
+
+        kind = self.tok_kind[idx]
+        if kind >= 0:
+            tok.kind = kind
+        if self.tok_line[idx]:
+            tok.pos = (self.tok_line[idx], self.tok_col[idx])
+        return tok
+
+    def _statement(self, idx, tail):
+        start = self.stmt_start[idx]
+        end = (self.stmt_start[idx + 1] if idx + 1 < len(self.stmt_start)
+               else len(self.tok_flags))
+
+        stmt = []
+        for i in range(start, end):
+            tok = self.token(i)
+            flags = self.tok_flags[i]
+            if not flags & TokenStream.HEAD_FREE:
+                tok.head = tail
+            tok.tail = self.liminals(i)
+            if not flags & TokenStream.TAIL_FREE:
+                tail = tok.tail
+            stmt.append(tok)
+
+        return stmt, tail
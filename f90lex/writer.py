@@ -0,0 +1,98 @@
+"""f90lex roundtrip writer.
+
+``render`` writes the roundtrip source of lexed statements to an output file.
+The text of each token (or its ``split`` or preprocessed form) and its tail
+liminals are gathered into a buffer, which is written to the output in bulk.
+
+``verify`` renders the statements into a hash, rather than a file, and checks
+that the result is identical to the original source without holding either
+text in memory.
+
+:copyright: Copyright 2021 Marshall Ward, see AUTHORS for details.
+:license: Apache License, Version 2.0, see LICENSE for details.
+"""
+import hashlib
+
+from f90lex.stream import TokenStream
+
+
+def render(statements, out, head=None, buffer_size=4096):
+    """Write the roundtrip source of statements to ``out``.
+
+    ``statements`` may be a ``Lexer``, a ``TokenStream``, or any sequence of
+    statements whose leading liminals are given by ``head``.  Text is written
+    in blocks of about ``buffer_size`` lexemes.  The number of characters
+    written is returned.
+    """
+    # Token streams hold the rendered text
+    if isinstance(statements, TokenStream):
+        out.write(statements.text)
+        return len(statements.text)
+
+    if head is None:
+        head = getattr(statements, 'prior_tail', [])
+
+    # NOTE: The lexer may extend the final tail of a statement while lexing
+    #   the next statement, so it is only rendered once the next statement
+    #   (or the end of the source) has been reached.
+    pending = head
+    buf = []
+    size = 0
+
+    for stmt in statements:
+        for tok in stmt:
+            buf.extend(pending)
+            buf.append(tok.split if tok.split else str(tok))
+            pending = tok.tail
+
+        if len(buf) > buffer_size:
+            text = ''.join(buf)
+            out.write(text)
+            size += len(text)
+            buf = []
+
+    buf.extend(pending)
+    text = ''.join(buf)
+    out.write(text)
+    size += len(text)
+
+    return size
+
+
+class HashWriter(object):
+    """A write-only file which records the hash of its content."""
+    def __init__(self, encoding='utf-8'):
+        self.hash = hashlib.sha256()
+        self.encoding = encoding
+
+    def write(self, text):
+        self.hash.update(text.encode(self.encoding, 'surrogateescape'))
+        return len(text)
+
+    def digest(self):
+        return self.hash.digest()
+
+
+def verify(statements, source, head=None, encoding='utf-8',
+           block_size=2**16):
+    """Return ``True`` if statements render to the same bytes as ``source``.
+
+    ``source`` is a path, or a binary file object, of the original source.
+    Both texts are compared by their hash, and neither is held in memory.
+
+    Note that sources with ``\\r\\n`` endlines will not match, since endlines
+    are translated by the lexer.
+    """
+    writer = HashWriter(encoding)
+    render(statements, writer, head=head)
+
+    original = hashlib.sha256()
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                original.update(block)
+    else:
+        for block in iter(lambda: source.read(block_size), b''):
+            original.update(block)
+
+    return writer.digest() == original.digest()
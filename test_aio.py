@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+import asyncio
+import concurrent.futures
+import io
+
+from f90lex.aio import AsyncLexer, DocumentLexer
+from f90lex.lexer import Lexer
+from test_project import source
+from test_scanner import sample
+
+text = (sample + source) * 20
+
+
+def values(statements):
+    return [[str(lx) for lx in stmt] for stmt in statements]
+
+
+def lex_output(head, statements):
+    out = list(head)
+    for stmt in statements:
+        for lx in stmt:
+            out.extend([str(lx), lx.split] + lx.tail)
+    return out
+
+
+def test_async_lexer():
+    lexer = Lexer(io.StringIO(text), defines={'N': '4'})
+    head = lexer.prior_tail
+    expected = lex_output(head, list(lexer))
+
+    async def run(executor):
+        # Count the turns of a concurrent task
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0)
+
+        task = asyncio.ensure_future(ticker())
+        lexer = AsyncLexer(text, lines=10, executor=executor,
+                           defines={'N': '4'})
+        statements = [stmt async for stmt in lexer]
+        task.cancel()
+
+        assert lex_output(lexer.head, statements) == expected
+        assert len(ticks) > 10
+
+    asyncio.run(run(None))
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        asyncio.run(run(executor))
+    with concurrent.futures.ProcessPoolExecutor(1) as executor:
+        asyncio.run(run(executor))
+
+
+def test_async_cancel():
+    async def run():
+        lexer = AsyncLexer(text, lines=10)
+        stmt = await lexer.__anext__()
+        assert values([stmt]) == values([next(Lexer(io.StringIO(text)))])
+
+        lexer.cancel()
+        try:
+            await lexer.__anext__()
+        except asyncio.CancelledError:
+            pass
+        else:
+            assert False
+
+        # Newer requests of a document supersede older ones
+        docs = DocumentLexer(lines=10)
+        old = docs.lex('doc.f90', text)
+        await asyncio.sleep(0)
+        new = docs.lex('doc.f90', source)
+        assert values(await new) == values(Lexer(io.StringIO(source)))
+        assert old.cancelled()
+        assert not docs.tasks
+
+    asyncio.run(run())
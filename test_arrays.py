@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+import io
+
+import pytest
+
+from f90lex import lex_files
+from f90lex.arrays import StringTable, project_arrays, stream_arrays
+from f90lex.ftoken import PToken
+from f90lex.lexer import Lexer
+from test_project import source, write_files
+from test_scanner import sample
+
+numpy = pytest.importorskip('numpy')
+
+
+def token_records(statements):
+    records = []
+    for sidx, stmt in enumerate(statements):
+        for idx, tok in enumerate(stmt):
+            records.append((
+                sidx, idx, str.__str__(tok), tok.split or str(tok),
+                -1 if tok.kind is None else tok.kind, tok.pos or (0, 0),
+                sum(len(lim) for lim in tok.tail), isinstance(tok, PToken),
+                bool(tok.split),
+            ))
+    return records
+
+
+def test_stream_arrays():
+    src = (sample + '#define FOO a + b\n  x = FOO * 2 ; y = "ab&\n'
+           '    &cd"\n')
+    expected = token_records(Lexer(io.StringIO(src)))
+
+    stream = Lexer(io.StringIO(src)).stream()
+    strings = StringTable()
+    batches = list(stream_arrays(stream, strings, size=8))
+    assert len(batches) > 1
+    for batch in batches[:-1]:
+        assert len(batch) >= 8
+
+    tokens = numpy.concatenate(batches)
+    assert len(tokens) == len(expected)
+    for rec, exp in zip(tokens, expected):
+        sidx, idx, value, text, kind, pos, lim_size, ptoken, split = exp
+        assert (rec['stmt'], rec['index']) == (sidx, idx)
+        assert strings[rec['value']] == value
+        assert stream.text[rec['start']:rec['end']] == text
+        assert rec['kind'] == kind
+        assert (rec['line'], rec['col']) == pos
+        assert rec['liminal_size'] == lim_size
+        assert (rec['ptoken'], rec['split']) == (ptoken, split)
+
+    assert tokens['ptoken'].sum() == 3
+    assert tokens['split'].sum() == 2
+
+    # Lexers are converted to a stream
+    lexer_tokens = numpy.concatenate(
+        list(stream_arrays(Lexer(io.StringIO(src)), strings))
+    )
+    assert (lexer_tokens == tokens).all()
+
+
+def test_project_arrays(tmpdir):
+    paths = write_files(tmpdir, [source, sample])
+    sizes = []
+    for path in paths:
+        with open(path) as f:
+            sizes.append(sum(len(stmt) for stmt in Lexer(f)))
+
+    strings = StringTable()
+    tokens = numpy.concatenate(list(project_arrays(paths, strings, size=4)))
+    assert list(numpy.bincount(tokens['file'])) == sizes
+    assert len(strings) == len(set(strings.values))
+
+    values = numpy.array(strings.values)[tokens['value']]
+    assert list(values[:5]) == ['call', 'serial_init', '(', 'ierr', ')']
+
+    # Streams are exported without lexing
+    streams = lex_files(paths, jobs=1)
+    stream_tokens = numpy.concatenate(list(project_arrays(streams, strings)))
+    assert (stream_tokens == tokens).all()
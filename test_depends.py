@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+import io
+import os
+
+from f90lex import depends_files
+from f90lex.depends import DependencyLexer, depends, depends_graph
+from test_scanner import sample
+
+source = """module foo
+  use bar, only: a, &
+      b
+  use, intrinsic :: iso_c_binding
+  use :: baz ; use qu&
+       &x
+  character(len=*), parameter :: s = 'use nope &
+      &use nope'
+  integer :: use
+#ifdef MPI
+  use mpi
+#else
+  use nompi
+#endif
+contains
+  module function f()
+  end function
+end module foo
+"""
+
+
+def test_dependency_lexer():
+    lexer = DependencyLexer(io.StringIO(sample + source))
+    stmts = list(lexer)
+    assert stmts == [
+        ['module', 'foo'],
+        ['use', 'bar', ',', 'only', ':', 'a', ',', 'b'],
+        ['use', ',', 'intrinsic', '::', 'iso_c_binding'],
+        ['use', '::', 'baz'],
+        ['use', 'qux'],
+        ['use', 'nompi'],
+        ['module', 'function', 'f', '(', ')'],
+    ]
+
+    deps = depends(stmts)
+    assert deps.modules == ['foo']
+    assert deps.uses == ['bar', 'baz', 'qux', 'nompi']
+
+    lexer = DependencyLexer(io.StringIO(source), defines={'MPI': ''})
+    assert depends(lexer).uses == ['bar', 'baz', 'qux', 'mpi']
+
+
+def test_depends_files(tmpdir):
+    texts = {
+        'bar.F90': 'module bar\n#include "defs.h"\nend module bar\n',
+        'foo.F90': source,
+        'child.f90': 'submodule (foo) child\n  include "x.inc"\nend\n',
+        'main.f90': 'program main; use foo; use bar\nend program\n',
+    }
+    paths = []
+    for name, text in texts.items():
+        path = os.path.join(str(tmpdir), name)
+        with open(path, 'w') as f:
+            f.write(text)
+        paths.append(path)
+
+    header = os.path.join(str(tmpdir), 'defs.h')
+    with open(header, 'w') as f:
+        f.write('#define BASE baz\n  use BASE\n')
+
+    file_deps = depends_files(paths, jobs=2)
+    bar, foo, child, main = paths
+    assert list(file_deps) == paths
+    assert file_deps[bar].uses == ['baz']
+    assert file_deps[bar].includes == [header]
+    assert file_deps[child].submodules == [('foo', 'child')]
+    assert file_deps[child].includes == ['x.inc']
+
+    graph = depends_graph(file_deps)
+    assert graph == {bar: [], foo: [bar], child: [foo], main: [foo, bar]}
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+from f90lex import ftoken
+from f90lex.ftoken import Token, PToken
+
+
+def test_token_symbols():
+    a, b, c = Token('Integer'), Token('INTEGER'), Token('real')
+
+    assert a == b and not a != b
+    assert a != c and not a == c
+    assert a == 'integer' and a != 'real'
+    assert a.key is b.key
+
+    assert hash(a) == hash(b) == hash('integer')
+    keywords = {'integer': 1, 'real': 2}
+    assert keywords[a] == 1 and keywords[c] == 2
+    assert len({a, b, c}) == 2
+
+    # Preprocessed tokens compare by value, not by macro
+    p = PToken('Real', pp='KIND')
+    assert p == c and p.key is c.key
+
+    # String literals are compared without case, but are not interned
+    s = Token("'ABC'")
+    assert s == "'abc'"
+    assert str.__str__(s) == "'ABC'"
+
+    # Numeric literals are not interned
+    n = Token('1.5D0')
+    assert n == '1.5d0' and '1.5D0' not in ftoken.symbols
+    assert '.5' not in ftoken.symbols and Token('.5') == '.5'
+    assert Token('.AND.') == '.and.' and '.AND.' in ftoken.symbols
+
+    # The table is bounded
+    max_symbols = ftoken.max_symbols
+    ftoken.max_symbols = len(ftoken.symbols)
+    try:
+        assert Token('Unseen') == 'unseen'
+        assert 'Unseen' not in ftoken.symbols
+    finally:
+        ftoken.max_symbols = max_symbols
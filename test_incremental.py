@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+import random
+
+from f90lex.incremental import IncrementalLexer
+from test_lexer import lex_output, links
+
+# NOTE: Random edits may split a continued string, so strings are only added
+#   in the range test.
+source = """program test
+  ! A comment line
+  integer(kind=8) :: x, y_2 = 1_8
+  real :: a = 1.5e-3, b = .5d0, c = 2._dp
+#define N 4
+  x = N ; y = 2 &
+       + 3
+#ifdef N
+  z = 1
+#else
+  z = 2
+#endif
+  ! Last comment
+"""
+
+edits = [
+    '  w = 5\n',
+    '  ! comment\n',
+    '\n',
+    '  a = b + &\n',
+    '   & c\n',
+    '#undef N\n',
+    '  q = 1 ; r = 2\n',
+    '#else\n',
+    '',
+]
+
+
+def check(inc):
+    full = IncrementalLexer(inc.text)
+    assert lex_output(inc.statements, inc.head) == \
+        lex_output(full.statements, full.head)
+    assert links(inc.statements) == links(full.statements)
+    assert not inc.statements or inc.statements[0][0].head is inc.head
+    assert inc.firsts == full.firsts
+    assert inc.states == full.states
+    assert [[lx.pos for lx in stmt] for stmt in inc.statements] == \
+        [[lx.pos for lx in stmt] for stmt in full.statements]
+
+
+def test_incremental():
+    rng = random.Random(0)
+    inc = IncrementalLexer(source)
+    check(inc)
+
+    for i in range(300):
+        start = rng.randint(0, len(inc.lines))
+        end = min(len(inc.lines), start + rng.randint(0, 3))
+        text = ''.join(rng.choice(edits) for _ in range(rng.randint(0, 2)))
+        inc.edit(start, end, text)
+        check(inc)
+
+
+def test_incremental_range():
+    lines = ['  x{} = {}\n'.format(i, i) for i in range(1000)]
+    inc = IncrementalLexer(''.join(lines))
+    assert inc.edit(500, 501, '  y = 1 + &\n  2\n') == (500, 501, 501)
+    check(inc)
+
+    assert inc.edit(200, 200, "  s = 'abc&\n    &def'\n") == (200, 200, 201)
+    check(inc)
+
+    # Several edits before the statements are read
+    inc.edit(900, 902, '')
+    inc.edit(100, 100, '  a = 1\n  b = 2\n')
+    inc.edit(950, 950, '  c = 3\n')
+    assert inc.statements[-1][0].pos == (1004, 3)
+    check(inc)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+import io
+import os
+
+from f90lex import StatementIndex
+from f90lex.index import statement_index
+from f90lex.lexer import Lexer
+from test_scanner import sample
+
+source = sample + """#define N 4
+  x = N ; y = N + &
+     1
+#ifdef N
+  z = N
+#endif
+"""
+
+
+def test_statement_index(tmpdir):
+    path = str(tmpdir.join('test.F90'))
+    with open(path, 'w') as f:
+        f.write(source)
+
+    expected = [[str(lx) for lx in stmt]
+                for stmt in Lexer(io.StringIO(source))]
+
+    index = statement_index(path)
+    assert len(index) == len(expected)
+    assert os.path.isfile(path + StatementIndex.suffix)
+
+    for k in range(len(expected)):
+        stmts = [[str(lx) for lx in stmt] for stmt in index.statements(k)]
+        assert stmts == expected[k:]
+
+    # Statements of the lines of the continued statement after ';'
+    lineno = sample.count('\n') + 2
+    stmts = [[str(lx) for lx in stmt]
+             for stmt in index.lines(lineno, lineno + 1)]
+    assert stmts == [['x', '=', 'N'], ['y', '=', 'N', '+', '1']]
+
+    # The saved index is reused, unless the source or settings change
+    saved = StatementIndex.load(path)
+    assert saved.points == index.points and saved.states == index.states
+    assert StatementIndex.load(path, defines={'N': '2'}) is None
+    os.utime(path, (0, 0))
+    assert StatementIndex.load(path) is None
+
+    # Non-UTF-8 files are indexed
+    with open(path, 'ab') as f:
+        f.write(b'! caf\xe9\n  w = 1\n')
+    index = statement_index(path)
+    stmts = [[str(lx) for lx in stmt]
+             for stmt in index.statements(len(index) - 1)]
+    assert stmts == [['w', '=', '1']]
+
+    # An index may be saved elsewhere
+    index_path = str(tmpdir.join('test.idx'))
+    index = statement_index(path, index_path=index_path)
+    assert os.path.isfile(index_path)
+    assert StatementIndex.load(path, index_path=index_path) is not None
+
+    # The index is built again if a header changes
+    header = str(tmpdir.join('header.h'))
+    with open(header, 'w') as f:
+        f.write('#define M 1\n')
+    with open(path, 'a') as f:
+        f.write('#include "header.h"\n  v = M\n')
+    index = statement_index(path)
+    assert StatementIndex.load(path) is not None
+    with open(header, 'w') as f:
+        f.write('#define M 22\n  u = M\n')
+    assert StatementIndex.load(path) is None
+    index = statement_index(path)
+    stmts = [[str.__str__(lx) for lx in stmt]
+             for stmt in index.statements(len(index) - 2)]
+    assert stmts == [['u', '=', '22'], ['v', '=', '22']]
@@ -1,8 +1,17 @@
 #!/usr/bin/env python
+import io
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
-from f90lex.lexer import Lexer
+from f90lex import condition, render, verify
+from f90lex.buffer import SourceBuffer
+from f90lex.include import IncludeCache
+from f90lex.lexer import Lexer, liminal_line
+from f90lex import scanner as sc
+from f90lex.stats import LexerStats
+from f90lex.stream import TokenStream
+from test_scanner import sample
 
 debug = False
 #debug = True
@@ -46,6 +55,452 @@ def test_lexer():
                 print(s, end='')
 
 
+def lex_output(lexer, head=None):
+    """Return the roundtrip output and tokens of a lexer."""
+    tokens = list(lexer.prior_tail if head is None else head)
+    for stmt in lexer:
+        for lx in stmt:
+            tokens.extend([str(lx), lx.split] + lx.tail)
+    return tokens
+
+
+def test_buffer_lexer(tmpdir):
+    fpath = os.path.join(str(tmpdir), 'sample.f90')
+    with open(fpath, 'w') as f:
+        f.write(sample)
+
+    expected = lex_output(Lexer(io.StringIO(sample)))
+    assert lex_output(Lexer(SourceBuffer(sample))) == expected
+    with SourceBuffer.open(fpath) as src:
+        assert lex_output(Lexer(src)) == expected
+
+
+def links(statements):
+    """Return the liminal sharing between all pairs of tokens."""
+    tokens = [lx for stmt in statements for lx in stmt]
+    return [[a.tail is b.head for b in tokens] for a in tokens]
+
+
+def test_token_stream():
+    src = sample + '#define FOO a + b\n  x = FOO * 2 ; y = 3\n'
+
+    lexer = Lexer(io.StringIO(src))
+    head = lexer.prior_tail
+    statements = list(lexer)
+
+    stream = Lexer(io.StringIO(src)).stream()
+    assert stream.text == src
+    assert stream.head == head
+    assert lex_output(stream, stream.head) == lex_output(
+        Lexer(io.StringIO(src))
+    )
+    assert links(stream) == links(statements)
+    assert [str(lx) for lx in stream[-2]] == [str(lx) for lx in statements[-2]]
+
+
+def test_include(tmpdir):
+    inc_dir = tmpdir.mkdir('include')
+    header = inc_dir.join('header.h')
+    header.write('#define M 3\n  integer :: a\n  integer :: b\n')
+
+    src = tmpdir.join('main.F90')
+    src.write('#include "header.h"\n  x = M\n')
+
+    cache = IncludeCache()
+    sizes = []
+    for i in range(2):
+        with open(str(src)) as f:
+            lexer = Lexer(f, include_paths=[str(inc_dir)], include_cache=cache)
+            stmts = [[lx.lower() for lx in stmt] for stmt in lexer]
+        assert sorted(stmts[:2]) == [['integer', '::', 'a'],
+                                     ['integer', '::', 'b']]
+        assert stmts[2] == ['x', '=', '3']
+        assert lexer.defines['M'] == ['3']
+        sizes.append(len(cache))
+
+    # The second lexer reuses the header statements
+    assert sizes[0] > 0 and sizes[1] == sizes[0]
+
+    # A modified header is lexed again
+    header.write('  integer :: c\n')
+    os.utime(str(header), (0, 0))
+    with open(str(src)) as f:
+        lexer = Lexer(f, include_paths=[str(inc_dir)], include_cache=cache)
+        stmts = [[lx.lower() for lx in stmt] for stmt in lexer]
+    assert stmts[0] == ['integer', '::', 'c']
+    assert len(cache) > sizes[0]
+
+
+def test_include_cache_stamps(tmpdir):
+    sub = tmpdir.mkdir('sub')
+    sub.join('n.h').write('  integer :: a\n')
+    tmpdir.join('outer.h').write('#include "sub/n.h"\n')
+    src = tmpdir.join('main.F90')
+    src.write('#include "outer.h"\n')
+
+    def lex(**kwargs):
+        with open(str(src)) as f:
+            lexer = Lexer(f, include_cache=cache, **kwargs)
+            return [[lx.lower() for lx in stmt] for stmt in lexer], lexer
+
+    cache = IncludeCache()
+    stmts, lexer = lex()
+    assert stmts == [['integer', '::', 'a']]
+    assert [stamp[0] for stamp in lexer.include_stamps] == [
+        str(tmpdir.join('outer.h')), str(sub.join('n.h'))
+    ]
+
+    # Modified nested headers are lexed again
+    sub.join('n.h').write('  integer :: b\n')
+    os.utime(str(sub.join('n.h')), (0, 0))
+    assert lex()[0] == [['integer', '::', 'b']]
+
+    # Headers are keyed by their search path
+    size = len(cache)
+    lex(include_paths=[str(sub)])
+    assert len(cache) == size + 2
+
+    # Least recently used headers are removed
+    cache = IncludeCache(max_entries=1)
+    lex()
+    assert len(cache) == 1
+
+
+def test_nested_include(tmpdir):
+    inner = tmpdir.join('inner.h')
+    inner.write('#define N 2\n  integer :: b(N)\n')
+    outer = tmpdir.join('outer.h')
+    outer.write('  integer :: a\n#include "inner.h"\n  integer :: c(N)\n')
+
+    src = tmpdir.join('main.F90')
+    src.write('#include "outer.h"\n#ifdef N\n  x = N\n#endif\n'
+              '  y = 1 + &\n#include "inner.h"\n    & N\n')
+
+    # Small cache limit, so that the headers are always streamed
+    cache = IncludeCache(max_statements=0)
+    with open(str(src)) as f:
+        lexer = Lexer(f, include_cache=cache)
+        stmts = [[str.__str__(lx).lower() for lx in stmt] for stmt in lexer]
+
+    assert stmts == [
+        ['integer', '::', 'a'],
+        ['integer', '::', 'b', '(', '2', ')'],
+        ['integer', '::', 'c', '(', '2', ')'],
+        ['x', '=', '2'],
+        ['y', '=', '1', '+', '2'],
+        ['integer', '::', 'b', '(', '2', ')'],
+    ]
+    assert len(cache) == 0
+
+    out = io.StringIO()
+    with open(str(src)) as f:
+        render(Lexer(f), out)
+    assert out.getvalue() == src.read()
+
+
+def test_lexer_stats():
+    source = sample + '#define N 4\n  x = N ; y = 2 &\n       + N\n'
+    stats = LexerStats()
+    lexer = Lexer(io.StringIO(source), stats=stats)
+    assert lex_output(lexer) == lex_output(Lexer(io.StringIO(source)))
+
+    assert stats.name is None
+    # Only code lines are parsed, except the inactive #ifdef line of the sample
+    code_lines = [line for line in source.splitlines()
+                  if line.strip() and line.lstrip()[0] not in '!#']
+    assert stats.calls['parse'] == len(code_lines) - 1
+    assert stats.calls['macros'] == 2
+    assert stats.counts['macros'] == 2
+    assert stats.counts['continuations'] >= 2
+    assert stats.counts['statements'] == len(list(Lexer(io.StringIO(source))))
+    assert all(t >= 0. for t in stats.times.values())
+
+    out = io.StringIO()
+    stats.dump(out)
+    assert out.getvalue().startswith('f90lex: stats: <source>\n')
+
+
+def test_render(tmpdir):
+    source = sample + '#define N 4\n  x = N ; y = 2 &\n       + N\n! end\n'
+    path = tmpdir.join('test.F90')
+    path.write(source)
+
+    for buffer_size in (1, 4096):
+        out = io.StringIO()
+        size = render(Lexer(io.StringIO(source)), out,
+                      buffer_size=buffer_size)
+        assert out.getvalue() == source and size == len(source)
+
+    out = io.StringIO()
+    render(Lexer(io.StringIO(source)).stream(), out)
+    assert out.getvalue() == source
+
+    assert verify(Lexer(io.StringIO(source)), str(path))
+    with open(str(path), 'rb') as f:
+        assert verify(Lexer(io.StringIO(source)), f)
+    assert not verify(Lexer(io.StringIO(source + '\n')), str(path))
+
+
+def test_long_continuation():
+    values = ['{}.5'.format(i) for i in range(2000)]
+    source = ('  x = [ &\n'
+              + ''.join('    {}, &\n'.format(v) for v in values)
+              + "    0. ] ; s = 'a &\n"
+              + ''.join('    &b &\n' for i in range(2000))
+              + "    &c' ; n = 1&\n&2&\n&3\n")
+
+    statements = list(Lexer(io.StringIO(source)))
+    assert [str(lx) for lx in statements[0][3:-1:2]] == values + ['0.']
+    assert str(statements[1][-1]) == "'a " + 'b ' * 2000 + "c'"
+    assert str(statements[2][-1]) == '123'
+
+    out = io.StringIO()
+    render(Lexer(io.StringIO(source)), out)
+    assert out.getvalue() == source
+
+    # Lexers in separate threads resplit tokens independently
+    source = '  x = 1&\n&.5e&\n&3 + ab&\n&c\n' * 500
+    expected = [[str(lx) for lx in stmt]
+                for stmt in Lexer(io.StringIO(source))]
+    with ThreadPoolExecutor(4) as pool:
+        results = pool.map(lambda i: [[str(lx) for lx in stmt]
+                                      for stmt in Lexer(io.StringIO(source))],
+                           range(8))
+        assert all(stmts == expected for stmts in results)
+
+    # Names and numbers split across many lines
+    for piece, kind in (('ab', sc.NAME), ('12', sc.INTEGER)):
+        source = '  x = ' + '&\n&'.join([piece] * 2000) + '\n'
+        tok = next(Lexer(io.StringIO(source)))[-1]
+        assert str(tok) == piece * 2000
+        assert tok.kind == kind
+
+
+def test_liminal_lines():
+    lines = ['\n', ' \t \n', '  ! comment & "\n', '!\n', '#define X 1\n',
+             '  #define Y\n']
+    for line in lines:
+        lexemes = sc.Scanner().parse(line)
+        assert [lx for lx in liminal_line(line).groups() if lx] == lexemes
+
+    # Other lines are left to the scanner
+    for line in ['  \r\n', '! no endline', ' ;\n', 'x = 1 ! c\n']:
+        assert liminal_line(line) is None
+
+    # Liminal lines within a split string and a continued statement
+    source = ('  s = "a&\n\n  ! c\n#define X 2\n  &b" ; t = X &\n'
+              '  #define Y\n  + 1\n')
+    stmts = [[str(lx) for lx in stmt] for stmt in Lexer(io.StringIO(source))]
+    assert stmts == [['s', '=', '"ab"'], ['t', '=', 'X', '+', '1']]
+
+    out = io.StringIO()
+    render(Lexer(io.StringIO(source)), out)
+    assert out.getvalue() == source
+
+
+def test_conditions():
+    source = (
+        '#define A 2\n'
+        '#define B (A + 1)\n'
+        '#if A > 1 && defined(B)\n'
+        '  x = 1\n'
+        '#elif 1\n'
+        '  x = 2\n'
+        '#else\n'
+        '  x = 3\n'
+        '#endif\n'
+        '#if B == 4\n'
+        '  y = 1\n'
+        '#elif defined C || B / 2 == 1\n'
+        '  y = 2\n'
+        '#else\n'
+        '  y = 3\n'
+        '#endif\n'
+        '#if 0\n'
+        '#if 1\n'
+        '  z = 0\n'
+        '#endif\n'
+        '#elif !defined(A)\n'
+        '  z = 1\n'
+        '#elif(-7 % A == -1 ? 0x10 >> 4 : 0)\n'
+        '  z = 2\n'
+        '#if C\n'
+        '  w = 1\n'
+        '#else\n'
+        '  w = 2\n'
+        '#endif\n'
+        '#else\n'
+        '  z = 3\n'
+        '#endif\n'
+    )
+    lexer = Lexer(io.StringIO(source))
+    stmts = [''.join(str(lx) for lx in stmt) for stmt in lexer]
+    assert stmts == ['x=1', 'y=2', 'z=2', 'w=2']
+
+    out = io.StringIO()
+    render(Lexer(io.StringIO(source)), out)
+    assert out.getvalue() == source
+
+    # Each expression (and macro value) is only compiled once
+    condition.conditions.clear()
+    list(Lexer(io.StringIO(source), defines={'C': '1'}))
+    compiled = dict(condition.conditions)
+    assert 'B / 2 == 1' not in compiled and '( A + 1 )' in compiled
+    for i in range(3):
+        list(Lexer(io.StringIO(source), defines={'C': '1'}))
+    assert condition.conditions == compiled
+
+    # Only the most recently used expressions are stored
+    max_conditions = condition.max_conditions
+    condition.max_conditions = 2
+    try:
+        for expr in ('1', '2', '1', '3'):
+            condition.evaluate(expr, {})
+        assert list(condition.conditions) == ['1', '3']
+    finally:
+        condition.max_conditions = max_conditions
+
+    # Resume from within the active branch of a conditional
+    state = Lexer(io.StringIO(source)).state()
+    assert state.lineno == 3
+    lines = io.StringIO(source).readlines()[state.lineno:]
+    resumed = Lexer(iter(lines), state=state)
+    assert [''.join(str(lx) for lx in stmt) for stmt in resumed] == stmts
+
+    # C comments are removed from expressions
+    source = ('#if A // A is true\n  x = 1\n#else\n  x = 2\n#endif\n'
+              '#if /* 0 // */ 1 // 0\n  y = 1\n#endif\n')
+    stmts = [''.join(str(lx) for lx in stmt)
+             for stmt in Lexer(io.StringIO(source), defines={'A': '1'})]
+    assert stmts == ['x=1', 'y=1']
+
+
+def test_inactive_regions():
+    source = (
+        '#ifdef A\n'
+        '#ifndef B\n'
+        '#define C 1\n'
+        '#else\n'
+        '#include "missing.h"\n'
+        '#endif\n'
+        '  x = 1\n'
+        '#else\n'
+        '  y = 2\n'
+        '#ifdef B\n'
+        '  z = 3\n'
+        '#endif\n'
+        '#endif\n'
+        '  w = 4\n'
+    )
+    stats = LexerStats()
+    lexer = Lexer(io.StringIO(source), stats=stats)
+    stmts = [[str(lx) for lx in stmt] for stmt in lexer]
+    assert stmts == [['y', '=', '2'], ['w', '=', '4']]
+    assert 'C' not in lexer.defines
+    # Directives are not parsed, and inactive lines are not read by a scanner
+    assert stats.calls['parse'] == 2
+
+    out = io.StringIO()
+    render(Lexer(io.StringIO(source)), out)
+    assert out.getvalue() == source
+
+    lexer = Lexer(io.StringIO(source), defines={'A': ''})
+    stmts = [[str(lx) for lx in stmt] for stmt in lexer]
+    assert stmts == [['x', '=', '1'], ['w', '=', '4']]
+    assert lexer.defines['C'] == ['1']
+
+
+def test_token_kinds():
+    source = ("#define N 4\n  x(1) = 'a &\n    &b' // s ; y = 1&\n"
+              "    &.5 + N\n")
+    statements = list(Lexer(io.StringIO(source)))
+    kinds = [[(str(lx), lx.kind) for lx in stmt] for stmt in statements]
+    assert kinds == [
+        [('x', sc.NAME), ('(', sc.OPERATOR), ('1', sc.INTEGER),
+         (')', sc.OPERATOR), ('=', sc.OPERATOR), ("'a b'", sc.STRING),
+         ('//', sc.OPERATOR), ('s', sc.NAME)],
+        [('y', sc.NAME), ('=', sc.OPERATOR), ('1.5', sc.REAL),
+         ('+', sc.OPERATOR), ('N', sc.INTEGER)],
+    ]
+
+    stream = Lexer(io.StringIO(source)).stream()
+    stream = TokenStream.frombytes(stream.tobytes())
+    assert [[lx.kind for lx in stmt] for stmt in stream] == [
+        [kind for lx, kind in stmt] for stmt in kinds
+    ]
+
+
+def test_token_positions():
+    source = ("#define N 4\n  x(1) = 'a &\n    &b' // s ; y = 1&\n"
+              "    &.5 + N\n")
+    statements = list(Lexer(io.StringIO(source)))
+    positions = [[(str(lx), lx.pos) for lx in stmt] for stmt in statements]
+    assert positions == [
+        [('x', (2, 3)), ('(', (2, 4)), ('1', (2, 5)), (')', (2, 6)),
+         ('=', (2, 8)), ("'a b'", (2, 10)), ('//', (3, 9)), ('s', (3, 12))],
+        [('y', (3, 16)), ('=', (3, 18)), ('1.5', (3, 20)), ('+', (4, 9)),
+         ('N', (4, 11))],
+    ]
+
+    stream = Lexer(io.StringIO(source)).stream()
+    stream = TokenStream.frombytes(stream.tobytes())
+    assert [[lx.pos for lx in stmt] for stmt in stream] == [
+        [pos for lx, pos in stmt] for stmt in positions
+    ]
+
+
+def test_binary_source():
+    source = ("! Température\n  s = 'π' ! \xe9\n  x = 1\n"
+              .encode('utf-8') + b'! caf\xe9\n')
+    statements = list(Lexer(io.BytesIO(source)))
+    assert [[str(lx) for lx in stmt] for stmt in statements] == [
+        ['s', '=', "'π'"], ['x', '=', '1'],
+    ]
+    assert statements[1][0].pos == (3, 3)
+
+    # Undecodable bytes are preserved
+    out = io.StringIO()
+    render(Lexer(io.BytesIO(source)), out)
+    assert out.getvalue().encode('utf-8', 'surrogateescape') == source
+
+    # Token streams and hashes preserve the bytes
+    stream = TokenStream.frombytes(Lexer(io.BytesIO(source)).stream()
+                                   .tobytes())
+    assert stream.text.encode('utf-8', 'surrogateescape') == source
+    assert [[str(lx) for lx in stmt] for stmt in stream] == [
+        ['s', '=', "'π'"], ['x', '=', '1'],
+    ]
+    assert verify(Lexer(io.BytesIO(source)), io.BytesIO(source))
+
+    # Source buffers decode the bytes as a binary lexer
+    buf = SourceBuffer(source)
+    assert lex_output(Lexer(buf)) == lex_output(Lexer(io.BytesIO(source)))
+    spans = [span for line in buf.scan() for span in line]
+    assert b''.join(buf.data[start:end] for start, end in spans) == source
+
+
+def test_binary_endlines():
+    source = "  x = 1 ! c\n  y = 'a&\n  &b'\n#define N 2\n  z = N\n"
+    statements = [[str(lx) for lx in stmt]
+                  for stmt in Lexer(io.StringIO(source))]
+
+    for endline in ('\r\n', '\r'):
+        data = source.replace('\n', endline).encode('utf-8')
+        for scanner in (sc.Scanner, sc.RegexScanner):
+            lexer = Lexer(io.BytesIO(data), scanner=scanner)
+            assert [[str(lx) for lx in stmt] for stmt in lexer] == statements
+            assert lexer.lineno == 5
+
+        out = io.StringIO()
+        render(Lexer(io.BytesIO(data)), out)
+        assert out.getvalue() == source
+
+        # Source buffers translate endlines as binary sources
+        lexer = Lexer(SourceBuffer(data))
+        assert [[str(lx) for lx in stmt] for stmt in lexer] == statements
+        assert lexer.lineno == 5
+
+
 if __name__ == '__main__':
     test_lexer()
     sys.exit()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+import io
+import os
+
+from f90lex import TokenCache, lex_chunks, lex_configs, lex_files
+from f90lex.chunks import split_points
+from f90lex.configs import ConfigSource
+from f90lex.lexer import Lexer
+from test_scanner import sample
+
+source = """#ifdef USE_MPI
+  call mpi_init(ierr)
+#else
+  call serial_init(ierr)
+#endif
+  x = N + 1
+"""
+
+
+def write_files(tmpdir, texts):
+    paths = []
+    for i, text in enumerate(texts):
+        path = os.path.join(str(tmpdir), 'file_{}.f90'.format(i))
+        with open(path, 'w') as f:
+            f.write(text)
+        paths.append(path)
+    return paths
+
+
+def test_lex_files(tmpdir):
+    paths = write_files(tmpdir, [sample, source, sample + source])
+    defines = {'USE_MPI': None, 'N': '4'}
+
+    streams = lex_files(paths, jobs=2, defines=defines)
+    assert list(streams) == paths
+    for path in paths:
+        with open(path) as f:
+            text = f.read()
+        lexer = Lexer(io.StringIO(text), defines=defines)
+        expected = [[str(lx) for lx in stmt] for stmt in lexer]
+        assert [[str(lx) for lx in stmt] for stmt in streams[path]] == expected
+        assert streams[path].text == text
+
+    stmts = list(streams[paths[1]])
+    assert [str(lx) for lx in stmts[0]] == [
+        'call', 'mpi_init', '(', 'ierr', ')',
+    ]
+    assert [lx.pp for lx in stmts[1][2:3]] == ['N']
+
+    # Non-UTF-8 files are lexed, with or without a cache
+    latin = b'! caf\xe9\n  x = 1\n'
+    with open(paths[0], 'wb') as f:
+        f.write(latin)
+    cache = TokenCache(os.path.join(str(tmpdir), 'cache'))
+    for stream_cache in (None, cache, cache):
+        stream = lex_files(paths[:1], cache=stream_cache)[paths[0]]
+        assert stream.text.encode('utf-8', 'surrogateescape') == latin
+
+
+def test_token_cache(tmpdir):
+    paths = write_files(tmpdir, [sample, source])
+    cache = TokenCache(os.path.join(str(tmpdir), 'cache'))
+
+    cold = lex_files(paths, jobs=1, cache=cache)
+    assert len(cache.entries()) == 2
+
+    warm = lex_files(paths, jobs=1, cache=cache)
+    for path in paths:
+        assert warm[path].text == cold[path].text
+        assert warm[path].tobytes() == cold[path].tobytes()
+
+    # Different defines produce a new entry
+    lex_files(paths[1:], jobs=1, defines={'USE_MPI': ''}, cache=cache)
+    assert len(cache.entries()) == 3
+
+    # Headers are searched as in an uncached lexer
+    with open(os.path.join(str(tmpdir), 'header.h'), 'w') as f:
+        f.write('  h = 1\n')
+    text = '#include "header.h"\n#include <header.h>\n'
+    paths = write_files(tmpdir, [text])
+    for i in range(2):
+        cached = lex_files(paths, jobs=1, cache=cache)[paths[0]]
+        uncached = lex_files(paths, jobs=1)[paths[0]]
+        assert cached.tobytes() == uncached.tobytes()
+        stmts = [[str.__str__(lx) for lx in stmt] for stmt in cached]
+        assert stmts == [['h', '=', '1']]
+
+    # Identical sources in other directories use their own headers
+    for name, value in (('a', '1'), ('b', '22')):
+        os.mkdir(os.path.join(str(tmpdir), name))
+        with open(os.path.join(str(tmpdir), name, 'header.h'), 'w') as f:
+            f.write('  h = {}\n'.format(value))
+    paths = [os.path.join(str(tmpdir), name, 'f.f90') for name in 'ab']
+    for path in paths:
+        with open(path, 'w') as f:
+            f.write(text)
+
+    def values(streams):
+        return [str.__str__(stmt[-1])
+                for path in paths for stmt in streams[path]]
+
+    assert values(lex_files(paths, jobs=1, cache=cache)) == ['1', '22']
+    assert values(lex_files(paths, jobs=1, cache=cache)) == ['1', '22']
+
+    # Entries with a changed header are lexed again
+    with open(os.path.join(str(tmpdir), 'a', 'header.h'), 'w') as f:
+        f.write('  h = 333\n')
+    assert values(lex_files(paths, jobs=1, cache=cache)) == ['333', '22']
+
+    # Eviction to a small limit
+    cache.max_size = 1
+    cache.evict()
+    assert not cache.entries()
+
+
+def test_lex_configs():
+    text = sample + source
+    configs = {
+        'serial': {'N': '4'},
+        'mpi': {'USE_MPI': None, 'N': '4'},
+        'mpi_debug': {'USE_MPI': None, 'N': '4', 'DEBUG': None},
+        'large': {'N': '100'},
+    }
+
+    streams = lex_configs(io.StringIO(text), configs)
+    assert list(streams) == list(configs)
+    for name, defines in configs.items():
+        lexer = Lexer(io.StringIO(text), defines=defines)
+        expected = [[str(lx) for lx in stmt] for stmt in lexer]
+        assert [[str(lx) for lx in stmt] for stmt in streams[name]] == expected
+        assert streams[name].text == text
+
+    # DEBUG does not appear in the source
+    assert streams['mpi_debug'] is streams['mpi']
+    assert streams['large'] is not streams['serial']
+
+    # Macros within the replacements of other macros may affect conditions
+    src = ConfigSource(io.StringIO('#if LEVEL > 1\n  x = 1\n#endif\n'))
+    assert src.key({'LEVEL': 'MAX', 'MAX': '2', 'N': '4'}) == (
+        ('LEVEL', 'MAX'), ('MAX', '2')
+    )
+
+    # Each line is only scanned once
+    src = ConfigSource(io.StringIO(text))
+    for defines in configs.values():
+        src.stream(defines)
+    assert len(src.table) <= len(set(src.lines))
+
+
+def test_lex_chunks(tmpdir):
+    text = (sample + source) * 4
+    path, = write_files(tmpdir, [text])
+    with open(path, 'rb') as f:
+        expected = Lexer(f, defines={'N': '4'}).stream()
+
+    # Chunks as small as possible
+    points = split_points(path, 1, defines={'N': '4'})
+    assert len(points) > 20
+
+    stream = lex_chunks(path, jobs=2, defines={'N': '4'}, chunk_size=1)
+    assert stream.tobytes() == expected.tobytes()
+    assert [[lx.pos for lx in stmt] for stmt in stream] == [
+        [lx.pos for lx in stmt] for stmt in expected
+    ]
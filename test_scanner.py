@@ -1,7 +1,42 @@
 #!/usr/bin/env python
+import random
 import sys
 
-from f90lex.scanner import Scanner
+from f90lex.scanner import Scanner, RegexScanner
+from f90lex import scanner as sc
+
+sample = r"""program test
+  ! A comment line
+  integer(kind=8) :: x, y_2 = 1_8, z = 3_int64
+  real :: a = 1.5e-3, b = .5d0, c = 2._dp, d = 1.eq.2
+  character(len=*), parameter :: s = 'it''s "quoted"', t = "a & b"
+  character(len=40) :: u = 'split &
+    &string &
+    &over lines'
+  logical :: p = .true. .and. .not. .false.
+  x = x**2 + y_2 / 3 ; y_2 = x // 'a'   ! trailing comment
+  if (x /= y_2 .or. a >= b) call foo(x, y_2, &
+       z)
+  p => q
+#ifdef FOO
+  print *, "str" ! comment
+#endif
+  end program test
+"""
+
+
+def scan_all(scanner, lines, kinds=True):
+    result = []
+    for line in lines:
+        try:
+            result.append(scanner.parse(line))
+            if kinds:
+                result.append(scanner.kinds)
+        except Exception as exc:
+            result.append(type(exc))
+            scanner.prior_delim = None
+        result.append(scanner.prior_delim)
+    return result
 
 
 def test_scanner():
@@ -14,5 +49,57 @@ def test_scanner():
             print(' · '.join([repr(lx)[1:-1] for lx in lexemes]))
 
 
+def test_regex_scanner():
+    lines = sample.splitlines(True)
+    assert scan_all(RegexScanner(), lines) == scan_all(Scanner(), lines)
+
+    # Random lines over a Fortran-heavy alphabet
+    rng = random.Random(0)
+    alphabet = 'ab_E1.9 \t\'"&!#:=/*();é'
+    lines = [
+        ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 12))) + '\n'
+        for _ in range(5000)
+    ]
+    assert scan_all(RegexScanner(), lines) == scan_all(Scanner(), lines)
+
+
+def test_regex_scan():
+    text = sample.replace('comment line', 'commentaire complété')
+    lines = text.splitlines(True)
+    expected = scan_all(Scanner(), lines, kinds=False)
+
+    # Text and bytes buffers, with Unix and DOS endlines
+    for buf in (text, text.encode('utf-8'), text.replace('\n', '\r\n')):
+        scanner = RegexScanner()
+        result = []
+        for spans in scanner.scan(buf):
+            lexemes = [buf[start:end] for start, end in spans]
+            if not isinstance(buf, str):
+                lexemes = [lx.decode('utf-8') for lx in lexemes]
+            lexemes[-1] = '\n'
+            result.extend([lexemes, scanner.prior_delim])
+        assert result == expected
+
+
+def test_kinds():
+    line = "  x(1) = .5 + 2_8 .and. 'a &\n"
+    scanner = Scanner()
+    lexemes = scanner.parse(line)
+    assert list(zip(lexemes, scanner.kinds)) == [
+        ('  ', sc.WHITESPACE), ('x', sc.NAME), ('(', sc.OPERATOR),
+        ('1', sc.INTEGER), (')', sc.OPERATOR), (' ', sc.WHITESPACE),
+        ('=', sc.OPERATOR), (' ', sc.WHITESPACE), ('.5', sc.REAL),
+        (' ', sc.WHITESPACE), ('+', sc.OPERATOR), (' ', sc.WHITESPACE),
+        ('2_8', sc.INTEGER), (' ', sc.WHITESPACE), ('.and.', sc.DOT_OPERATOR),
+        (' ', sc.WHITESPACE), ("'a ", sc.STRING), ('&', sc.CONTINUATION),
+        ('\n', sc.ENDLINE),
+    ]
+
+    # Continued strings
+    scanner.parse("  & b' ! end\n")
+    assert scanner.kinds == [sc.WHITESPACE, sc.CONTINUATION, sc.WHITESPACE,
+                             sc.STRING, sc.WHITESPACE, sc.COMMENT, sc.ENDLINE]
+
+
 if __name__ == '__main__':
     test_scanner()
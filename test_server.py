@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+import os
+import threading
+
+import pytest
+
+from f90lex.lexer import Lexer
+from f90lex.server import LexClient, LexServer, StreamStore
+from test_scanner import sample
+
+
+def test_lex_server(tmpdir):
+    src_dir = tmpdir.mkdir('src')
+    path = str(src_dir.join('test.F90'))
+    with open(path, 'w') as f:
+        f.write(sample)
+
+    # Non-UTF-8 files are served, and unlexable files are skipped
+    latin_path = str(src_dir.join('latin.F90'))
+    latin = b'! caf\xe9\n  x = 1\n'
+    with open(latin_path, 'wb') as f:
+        f.write(latin)
+    with open(str(src_dir.join('bad.F90')), 'w') as f:
+        f.write('#include bad.h\n')
+
+    sock = str(tmpdir.join('f90lex.sock'))
+    server = LexServer(sock, str(src_dir))
+    assert server.warm() == 2
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        with LexClient(sock) as client:
+            with open(path, 'rb') as f:
+                expected = [[str(lx) for lx in stmt] for stmt in Lexer(f)]
+            for i in range(2):
+                stmts = [[str(lx) for lx in stmt] for stmt in client.lex(path)]
+                assert stmts == expected
+            assert server.store.lex_count == 2
+
+            stream = client.stream(latin_path)
+            assert stream.text.encode('utf-8', 'surrogateescape') == latin
+
+            # Touched files are not lexed again
+            os.utime(path, (0, 0))
+            client.stream(path)
+            assert server.store.lex_count == 2
+
+            # Modified files are lexed again
+            with open(path, 'a') as f:
+                f.write('  x = N\n')
+            stream = client.stream(path, defines={'N': '4'})
+            assert server.store.lex_count == 3
+            last = list(stream)[-1]
+            assert [str.__str__(lx) for lx in last] == ['x', '=', '4']
+            assert stream.text == sample + '  x = N\n'
+
+            with pytest.raises(OSError):
+                client.stream(str(tmpdir.join('f90lex.sock')))
+
+            # Files which cannot be lexed are reported, and the connection
+            # is kept open
+            with pytest.raises(OSError):
+                client.stream(str(src_dir.join('bad.F90')))
+            assert len(client.stream(latin_path)) == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+    assert not os.path.exists(sock)
+
+    # Only sockets are replaced
+    with pytest.raises(OSError):
+        LexServer(path, str(src_dir))
+    with open(path) as f:
+        assert f.read() == sample + '  x = N\n'
+
+
+def test_stream_store(tmpdir):
+    paths = []
+    for i in range(3):
+        paths.append(str(tmpdir.join('f{}.f90'.format(i))))
+        with open(paths[-1], 'w') as f:
+            f.write('  x = {}\n'.format(i))
+
+    store = StreamStore(max_entries=2)
+    for path in paths:
+        store.get(path)
+    store.get(paths[1], defines={'N': '1'})
+    assert [key[0] for key in store.entries] == paths[2:] + paths[1:2]
+
+    # Removed files are dropped
+    os.remove(paths[2])
+    with pytest.raises(OSError):
+        store.get(paths[2])
+    assert [key[0] for key in store.entries] == paths[1:2]